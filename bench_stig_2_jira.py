@@ -0,0 +1,216 @@
+#! /usr/bin/python
+"""
+Benchmark suite for STIG2Jira app
+
+Times and memory-profiles the hot paths of stig_2_jira.py (parsing, model
+building, report generation, Jira payload serialization and export against
+a local mock_jira.MockJira) on the bundled Windows 7 benchmark and on
+synthetic copies scaled up by repeating its groups. Results are written as JSON so runs can be compared across
+changes.
+
+Args:
+--scales: comma separated scale factors, default 1,10,100
+--export-scales: scale factors the HTTP export is run at, default 1
+--repeat: timing runs per case, the best one is kept
+--output: file the JSON results are written to, default stdout
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import tempfile
+import time
+import tracemalloc
+from xml.dom.minidom import parse
+
+import stig_2_jira
+from mock_jira import MockJira
+
+XML_FILE = stig_2_jira.XML_FILE
+
+
+def scaled_xccdf(xml_file, factor, path):
+    """Write a copy of xml_file with every Group repeated factor times
+
+    Copies get a -x<n> suffix on their Group and Rule ids so the result is
+    still a valid benchmark with unique ids.
+
+    Args:
+        xml_file: source XCCDF document
+        factor: how many copies of the groups to write
+        path: file the scaled document is written to
+
+    Returns:
+        path
+    """
+    with open(xml_file, encoding='utf-8') as f:
+        _text = f.read()
+    _start = _text.index('<Group ')
+    _end = _text.rindex('</Benchmark>')
+    _groups = _text[_start:_end]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(_text[:_start])
+        f.write(_groups)
+        for i in range(2, factor + 1):
+            _suffix = '-x%d"' % i
+            f.write(re.sub(r'(<(?:Group|Rule) id="[^"]*)"',
+                           lambda m: m.group(1) + _suffix, _groups))
+        f.write(_text[_end:])
+    return path
+
+
+def parse_minidom(xml_file):
+    """The original main() parse, whole document loaded through minidom"""
+    _doc = parse(xml_file)
+    return [stig_2_jira.parse_group(x) for x in _doc.getElementsByTagName('Group')]
+
+
+def parse_stream(xml_file):
+    return list(stig_2_jira.iter_groups(xml_file))
+
+
+def scan_lazy(xml_file):
+    return list(stig_2_jira.iter_lazy_groups(xml_file))
+
+
+def build_model(groups):
+    return stig_2_jira.StigBenchmark(groups)
+
+
+def render_report(groups, fmt):
+    _out = io.StringIO()
+    stig_2_jira.write_report(groups, _out, fmt)
+    return _out.tell()
+
+
+def serialize_payloads(groups):
+    """Build and JSON encode the Jira issue payload of every group"""
+    _bytes = 0
+    for group in groups:
+        _fields = stig_2_jira._group_to_fields(group, '10108', 'bench')
+        _bytes += len(json.dumps({"fields": _fields}))
+    return _bytes
+
+
+def export_sequential(groups, url):
+    with stig_2_jira.JiraSession() as _session:
+        for group in groups:
+            stig_2_jira._json_to_jira(group, '10108', 'bench', url, _session,
+                                      stig_2_jira.JiraScheduler())
+
+
+def export_concurrent(groups, url):
+    stig_2_jira._async_to_jira(groups, '10108', 'bench', url,
+                               stig_2_jira.JIRA_CONCURRENCY, None,
+                               stig_2_jira.JiraScheduler())
+
+
+def export_bulk(groups, url):
+    with stig_2_jira.JiraSession() as _session:
+        stig_2_jira._bulk_to_jira(groups, '10108', 'bench', url + '/bulk',
+                                  stig_2_jira.JIRA_BULK_SIZE, _session,
+                                  stig_2_jira.JiraScheduler())
+
+
+def measure(func, repeat):
+    """Time func (best of repeat runs) and then trace its peak memory
+
+    Args:
+        func: callable taking no arguments
+        repeat: number of timed runs
+
+    Returns:
+        dict with seconds (best run) and peak_bytes (traced separately so
+        tracing overhead does not skew the timing)
+    """
+    _best = None
+    for i in range(repeat):
+        gc.collect()
+        _start = time.perf_counter()
+        func()
+        _elapsed = time.perf_counter() - _start
+        if _best is None or _elapsed < _best:
+            _best = _elapsed
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": _best, "peak_bytes": _peak}
+
+
+def run(scales, export_scales, repeat):
+    """Run every case at every scale
+
+    Returns:
+        dict ready to be dumped as JSON
+    """
+    _results = []
+    _tmp_dir = tempfile.mkdtemp()
+    _mock = MockJira().start()
+    _url = _mock.issue_url
+    try:
+        for _scale in scales:
+            if _scale == 1:
+                _xml = XML_FILE
+            else:
+                _xml = scaled_xccdf(XML_FILE, _scale,
+                                    os.path.join(_tmp_dir, 'x%d.xml' % _scale))
+            _groups = parse_stream(_xml)
+            _cases = [
+                ('parse_minidom', lambda: parse_minidom(_xml)),
+                ('parse_stream', lambda: parse_stream(_xml)),
+                ('scan_lazy', lambda: scan_lazy(_xml)),
+                ('build_model', lambda: build_model(_groups)),
+                ('report_html', lambda: render_report(_groups, 'html')),
+                ('report_md', lambda: render_report(_groups, 'md')),
+                ('report_csv', lambda: render_report(_groups, 'csv')),
+                ('serialize_payloads', lambda: serialize_payloads(_groups)),
+                ]
+            if _scale in export_scales:
+                _cases.extend([
+                    ('export_sequential', lambda: export_sequential(_groups, _url)),
+                    ('export_concurrent', lambda: export_concurrent(_groups, _url)),
+                    ('export_bulk', lambda: export_bulk(_groups, _url)),
+                    ])
+            for _name, _func in _cases:
+                _mock.reset()
+                _result = {"case": _name, "scale": _scale, "groups": len(_groups)}
+                _result.update(measure(_func, repeat))
+                _results.append(_result)
+    finally:
+        _mock.stop()
+        shutil.rmtree(_tmp_dir)
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "time": time.time(), "results": _results}
+
+
+def main(argv=None):
+    _parser = argparse.ArgumentParser(description='Benchmark STIG2Jira hot paths')
+    _parser.add_argument('--scales', default='1,10,100',
+                         help='comma separated scale factors')
+    _parser.add_argument('--export-scales', default='1',
+                         help='scale factors the HTTP export cases run at')
+    _parser.add_argument('--repeat', type=int, default=3,
+                         help='timed runs per case, the best one is kept')
+    _parser.add_argument('--output', help='write JSON here instead of stdout')
+    _args = _parser.parse_args(argv)
+    _scales = [int(x) for x in _args.scales.split(',')]
+    _export_scales = [int(x) for x in _args.export_scales.split(',') if x]
+    _data = run(_scales, _export_scales, _args.repeat)
+    if _args.output:
+        with open(_args.output, 'w') as f:
+            json.dump(_data, f, indent=1)
+    else:
+        print(json.dumps(_data, indent=1))
+    return True
+
+
+if __name__ == '__main__':
+    main()
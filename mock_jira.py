@@ -0,0 +1,363 @@
+#! /usr/bin/python
+"""
+Local stand-in for the Jira REST API used by STIG2Jira
+
+Serves the parts of /rest/api/2 that stig_2_jira.py talks to: issue create,
+bulk create, get, update, transitions and JQL search. Latency, server errors
+and 429 throttling can be injected so the exporter's concurrency, batching
+and retry behaviour can be measured offline, and every request received is
+recorded for later inspection.
+
+Args:
+--port: port to listen on, default 8080
+--latency: seconds added to every response
+--error-rate: fraction of requests answered with a 503
+--throttle-rate: fraction of requests answered with a 429
+--rate-limit: requests per second allowed before answering 429
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+API = '/rest/api/2'
+
+
+class MockJira(object):
+    """An in-process fake Jira server
+
+    Attributes:
+        latency: seconds every response is delayed by
+        jitter: extra random delay of up to this many seconds
+        error_rate: fraction of requests answered with a 503
+        throttle_rate: fraction of requests answered with a 429
+        rate_limit: requests per second accepted before answering 429
+        retry_after: Retry-After seconds sent with every 429
+        project_key: prefix of the issue keys handed out
+        max_results: cap on maxResults for searches
+        issues: dict of issue key to {"id", "key", "fields"}
+        requests: list of (time, method, path, body) for every request
+        responses: dict of status code to number of responses sent
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, throttle_rate=0.0, rate_limit=None,
+                 retry_after=1, project_key='STIG', max_results=1000,
+                 seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.project_key = project_key
+        self.max_results = max_results
+        self.issues = {}
+        self.requests = []
+        self.responses = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_id = 10000
+        self._tokens = rate_limit or 0
+        self._refilled = time.time()
+        self._server = ThreadingHTTPServer((host, port), _MockJiraHandler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base url of the server, e.g. http://127.0.0.1:8080"""
+        _host, _port = self._server.server_address[:2]
+        return 'http://%s:%d' % (_host, _port)
+
+    @property
+    def issue_url(self):
+        """Url of the issue create endpoint"""
+        return self.url + API + '/issue'
+
+    def start(self):
+        """Serve requests on a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def reset(self):
+        """Forget every issue and recorded request"""
+        with self._lock:
+            self.issues = {}
+            self.requests = []
+            self.responses = {}
+
+    def _fault(self):
+        """Status code to answer with instead of handling, or None"""
+        with self._lock:
+            if self.rate_limit:
+                _now = time.time()
+                self._tokens = min(self.rate_limit, self._tokens +
+                                   (_now - self._refilled) * self.rate_limit)
+                self._refilled = _now
+                if self._tokens < 1:
+                    return 429
+                self._tokens -= 1
+            _roll = self._random.random()
+            if _roll < self.throttle_rate:
+                return 429
+            if _roll < self.throttle_rate + self.error_rate:
+                return 503
+            return None
+
+    def _delay(self):
+        _delay = self.latency
+        if self.jitter:
+            with self._lock:
+                _delay += self._random.uniform(0, self.jitter)
+        if _delay > 0:
+            time.sleep(_delay)
+
+    def _create(self, fields):
+        """Validate and store one issue, returns (issue or None, errors)"""
+        _errors = {}
+        for _name in ('project', 'summary', 'issuetype'):
+            if not fields.get(_name):
+                _errors[_name] = '%s is required.' % _name
+        if _errors:
+            return None, _errors
+        with self._lock:
+            self._next_id += 1
+            _id = str(self._next_id)
+            _key = '%s-%d' % (self.project_key, self._next_id)
+            _fields = dict(fields)
+            _fields.setdefault('status', {'name': 'Open'})
+            self.issues[_key] = {'id': _id, 'key': _key, 'fields': _fields}
+        return {'id': _id, 'key': _key,
+                'self': self.url + API + '/issue/' + _id}, None
+
+    def _search(self, jql, start_at, max_results, fields):
+        """Run a (small subset of) JQL query over the stored issues"""
+        _match = _compile_jql(jql)
+        with self._lock:
+            _found = [x for x in self.issues.values() if _match(x)]
+        _found.sort(key=lambda x: int(x['id']))
+        _max = min(max_results, self.max_results)
+        _page = []
+        for _issue in _found[start_at:start_at + _max]:
+            _fields = _issue['fields']
+            if fields:
+                _fields = dict((k, v) for k, v in _fields.items() if k in fields)
+            _page.append({'id': _issue['id'], 'key': _issue['key'],
+                          'fields': _fields})
+        return {'startAt': start_at, 'maxResults': _max, 'total': len(_found),
+                'issues': _page}
+
+
+def _compile_jql(jql):
+    """Turn a JQL string into a predicate over stored issues
+
+    Supports clauses joined by AND of the forms: field = value,
+    field != value and field in (value, ...), where field is project,
+    labels, status or key. Anything else raises ValueError.
+    """
+    _tests = []
+    for _clause in re.split(r'\s+AND\s+', jql.strip(), flags=re.I):
+        if not _clause:
+            continue
+        _m = re.match(r'^(\w+)\s*(=|!=|\bin\b)\s*(.+)$', _clause.strip(), re.I)
+        if _m is None:
+            raise ValueError('Unsupported JQL: %s' % _clause)
+        _field, _op, _value = _m.group(1).lower(), _m.group(2).lower(), _m.group(3)
+        if _op == 'in':
+            _values = set(_unquote(x) for x in
+                          re.findall(r'"[^"]*"|\'[^\']*\'|[^,()\s]+', _value))
+        else:
+            _values = set([_unquote(_value.strip())])
+        _tests.append((_field, _op == '!=', _values))
+
+    def _match(issue):
+        for _field, _negate, _values in _tests:
+            _have = _field_values(issue, _field)
+            if bool(_have & _values) == _negate:
+                return False
+        return True
+    return _match
+
+
+def _unquote(value):
+    if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+        return value[1:-1]
+    return value
+
+
+def _field_values(issue, field):
+    """Set of comparable values of a field on a stored issue"""
+    _fields = issue['fields']
+    if field == 'key':
+        return set([issue['key']])
+    if field == 'labels':
+        return set(_fields.get('labels', []))
+    if field == 'project':
+        _project = _fields.get('project', {})
+        return set(str(x) for x in (_project.get('id'), _project.get('key'))
+                   if x is not None)
+    if field == 'status':
+        return set([_fields.get('status', {}).get('name')])
+    raise ValueError('Unsupported JQL field: %s' % field)
+
+
+class _MockJiraHandler(BaseHTTPRequestHandler):
+    """Routes requests to the MockJira attached to the server"""
+    protocol_version = 'HTTP/1.1'
+    #Send headers and body in one segment, keep-alive stalls on delayed ACKs otherwise
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body=None, headers=None):
+        _data = b''
+        if body is not None:
+            _data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(_data)))
+        for _name in (headers or {}):
+            self.send_header(_name, headers[_name])
+        self.end_headers()
+        self.wfile.write(_data)
+        _mock = self.server.mock
+        with _mock._lock:
+            _mock.responses[status] = _mock.responses.get(status, 0) + 1
+
+    def _handle(self, method):
+        _mock = self.server.mock
+        _length = int(self.headers.get('Content-Length') or 0)
+        _raw = self.rfile.read(_length) if _length else b''
+        _parts = urlsplit(self.path)
+        with _mock._lock:
+            _mock.requests.append((time.time(), method, self.path,
+                                   _raw.decode('utf-8', 'replace')))
+        _mock._delay()
+        _fault = _mock._fault()
+        if _fault == 429:
+            return self._reply(429, {'errorMessages': ['Rate limit exceeded']},
+                               {'Retry-After': str(_mock.retry_after)})
+        if _fault is not None:
+            return self._reply(_fault, {'errorMessages': ['Service unavailable']})
+        try:
+            _body = json.loads(_raw) if _raw else {}
+        except ValueError:
+            return self._reply(400, {'errorMessages': ['Invalid JSON']})
+        _path = _parts.path.rstrip('/')
+        if not _path.startswith(API):
+            return self._reply(404, {'errorMessages': ['Not found']})
+        _route = _path[len(API):].split('/')[1:]
+        try:
+            return self._route(method, _route, _body, parse_qs(_parts.query))
+        except ValueError as e:
+            return self._reply(400, {'errorMessages': [str(e)]})
+
+    def _route(self, method, route, body, query):
+        _mock = self.server.mock
+        if route == ['issue'] and method == 'POST':
+            _issue, _errors = _mock._create(body.get('fields', {}))
+            if _issue is None:
+                return self._reply(400, {'errorMessages': [], 'errors': _errors})
+            return self._reply(201, _issue)
+        if route == ['issue', 'bulk'] and method == 'POST':
+            _issues = []
+            _failed = []
+            for i, _update in enumerate(body.get('issueUpdates', [])):
+                _issue, _errors = _mock._create(_update.get('fields', {}))
+                if _issue is None:
+                    _failed.append({'status': 400, 'failedElementNumber': i,
+                                    'elementErrors': {'errorMessages': [],
+                                                      'errors': _errors}})
+                else:
+                    _issues.append(_issue)
+            return self._reply(201 if _issues else 400,
+                               {'issues': _issues, 'errors': _failed})
+        if route == ['search'] and method in ('GET', 'POST'):
+            if method == 'GET':
+                body = {'jql': query.get('jql', [''])[0],
+                        'startAt': query.get('startAt', [0])[0],
+                        'maxResults': query.get('maxResults', [50])[0],
+                        'fields': ','.join(query.get('fields', [])).split(',')}
+            _fields = [x for x in body.get('fields') or [] if x]
+            return self._reply(200, _mock._search(body.get('jql', ''),
+                                                  int(body.get('startAt', 0)),
+                                                  int(body.get('maxResults', 50)),
+                                                  _fields))
+        if len(route) >= 2 and route[0] == 'issue':
+            _issue = _mock.issues.get(route[1])
+            if _issue is None:
+                return self._reply(404, {'errorMessages': ['Issue Does Not Exist']})
+            if len(route) == 2 and method == 'GET':
+                return self._reply(200, _issue)
+            if len(route) == 2 and method == 'PUT':
+                with _mock._lock:
+                    _issue['fields'].update(body.get('fields', {}))
+                return self._reply(204)
+            if route[2:] == ['transitions'] and method == 'POST':
+                with _mock._lock:
+                    _issue['fields']['status'] = {'name': 'Closed'}
+                return self._reply(204)
+        return self._reply(404, {'errorMessages': ['Not found']})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+
+def main(argv=None):
+    _parser = argparse.ArgumentParser(description='Run a mock Jira REST server')
+    _parser.add_argument('--host', default='127.0.0.1')
+    _parser.add_argument('--port', type=int, default=8080)
+    _parser.add_argument('--latency', type=float, default=0.0,
+                         help='seconds added to every response')
+    _parser.add_argument('--jitter', type=float, default=0.0,
+                         help='extra random delay of up to this many seconds')
+    _parser.add_argument('--error-rate', type=float, default=0.0,
+                         help='fraction of requests answered with a 503')
+    _parser.add_argument('--throttle-rate', type=float, default=0.0,
+                         help='fraction of requests answered with a 429')
+    _parser.add_argument('--rate-limit', type=float,
+                         help='requests per second allowed before a 429')
+    _parser.add_argument('--retry-after', type=int, default=1,
+                         help='Retry-After seconds sent with every 429')
+    _args = _parser.parse_args(argv)
+    _mock = MockJira(_args.host, _args.port, _args.latency, _args.jitter,
+                     _args.error_rate, _args.throttle_rate, _args.rate_limit,
+                     _args.retry_after)
+    print('Mock Jira listening on %s' % _mock.issue_url)
+    try:
+        _mock._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print('%d requests, %d issues, responses %s' % (
+        len(_mock.requests), len(_mock.issues), _mock.responses))
+    return True
+
+
+if __name__ == '__main__':
+    main()
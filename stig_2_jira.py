@@ -16,17 +16,60 @@ Args:
 XML_FILE: file of the xml document
 """
 #import xml.dom.minidom
-from xml.dom.minidom import parse
+from xml.dom.minidom import parse, parseString
+from xml.dom import pulldom
 #import unittest
+import os
+import sys
+import argparse
 import time
+import multiprocessing
+import functools
+import asyncio
+import concurrent.futures
+import threading
+import queue
+import sqlite3
+import random
+import email.utils
+import hashlib
+import pickle
+import html
+import csv
+import io
+import re
+import bisect
+import mmap
+import math
 import logging
 import json
 import requests
+import urllib3
 
 DEF_SEVERITY = 'high'
 DEF_WEIGHT = '10'
 XML_FILE = 'U_Windows_7_V1R13_STIG_Manual-xccdf.xml' 
+JIRA_AUTH = ("jirasys","xxxxxxxx")
+JIRA_PROJECT = "10108"      #Change this to specific Project Number
+JIRA_USER = "634273"        #Change to users Jira loging
+JIRA_URL = "http://jira.cmc.hl.com/rest/api/2/issue"
+JIRA_POOL_SIZE = 10
+JIRA_TIMEOUT = (5, 30)      #(connect, read) seconds
+JIRA_BULK_SIZE = 50
+JIRA_CONCURRENCY = 8
+JIRA_MAX_RETRIES = 5
+JIRA_SEARCH_BATCH = 100      #labels per reconciliation search
+JIRA_SEARCH_PAGE = 1000
+JIRA_CLOSE_TRANSITION = "2"     #"Close Issue" in the default Jira workflow
+PARSER_VERSION = 2     #Bump whenever parsing changes what ends up in the model
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'stig2jira')
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+REPORT_BUFFER_SIZE = 1024 * 1024
+PRIORITY_SEVERITIES = {'high': 1, 'medium': 2, 'low': 3}
+PRIORITY_THRESHOLDS = (14, 18, 22, 26)     #severity rank * weight cut offs
 stig_groups = []
+_default_session = None
+_default_scheduler = None
 
 
 class StigIdent(object):
@@ -36,8 +79,7 @@ class StigIdent(object):
         system: a cross reference to DISA tracking
         content: the actual content of the ident
     """
-    system = None
-    content = None
+    __slots__ = ('system', 'content')
     
     def __init__(self, sys = None, content = None):
         self.system = sys
@@ -51,8 +93,7 @@ class StigFixtext(object):
         fixref: a cross reference to DISA tracking
         content: the actual content of the fixtext
     """
-    fixref = None
-    content = None
+    __slots__ = ('fixref', 'content')
     
     def __init__(self, fixref, content):
         self.fixref = fixref
@@ -65,7 +106,7 @@ class StigFix(object):
     Attributes:
         fix_id: a cross reference DISA id
     """
-    fix_id = None
+    __slots__ = ('fix_id',)
     
     def __init__(self, fix_id):
         self.fix_id = fix_id
@@ -81,11 +122,7 @@ class StigReference(object):
         subject: What subject (e.g., OS, hardware device, etc)
         identifier: DISA provided identifier
     """
-    title = None
-    publisher = None
-    type = None
-    subject = None
-    identifier = None
+    __slots__ = ('title', 'publisher', 'type', 'subject', 'identifier')
     
     def __init__(self, title, pub, type, subject, id):
         self.title = title
@@ -100,10 +137,8 @@ class StigCheck(object):
     This a private class is an internal class built to store the specific check data for
     a given STIG rule.
     """
-    SYSTEM = None
-    NAME = None
-    HREF = None
-    CONTENT = None
+    __slots__ = ('SYSTEM', 'NAME', 'HREF', 'CONTENT')
+    
     def __init__(self, name, sys = '', href = '', content = ''):
         """
         This class is built to easily store and manipulate the various checks within
@@ -141,19 +176,9 @@ class StigRule(object):
         checks: array of checks to perform to determine if a finding exists
     
     """
-    ID = None
-    VERSION = None
-    TITLE = None
-    DESCRIPTION = None
-    REFERENCE = None
-    IDENT = None
-    FIXTEXT = None
-    FIX = None
-    _DISA_SEVERITY = DEF_SEVERITY
-    severity = DEF_SEVERITY
-    _DISA_WEIGHT = DEF_WEIGHT
-    weight = DEF_WEIGHT
-    checks = []
+    __slots__ = ('ID', 'VERSION', 'TITLE', 'DESCRIPTION', 'REFERENCE', 'IDENT',
+                 'FIXTEXT', 'FIX', '_DISA_SEVERITY', 'severity', '_DISA_WEIGHT',
+                 'weight', 'checks')
     
     def __init__(self, id, ver, title, desc, ref, ident, fixtext, fix, severity = DEF_SEVERITY, weight=DEF_WEIGHT):
         """Inits StigGroup with id, title, desc and a null array of Rules
@@ -253,10 +278,7 @@ class StigGroup(object):
         DESCRIPTION: longer description of group
         RULES: array of rules to check specific group
     """
-    ID = None
-    TITLE = None
-    DESCRIPTION = None
-    rules = []
+    __slots__ = ('ID', 'TITLE', 'DESCRIPTION', 'rules')
     
     def __init__(self, id, title, desc):
         """Inits StigGroup with id, title, desc and a null array of Rules
@@ -295,6 +317,123 @@ class StigGroup(object):
         return True
 
         
+class StigBenchmark(object):
+    """Class for a whole parsed benchmark with lookup indexes
+    
+    The indexes are hash tables built once as groups are added, so every 
+    lookup is a dict access instead of a scan over all the groups. Rule
+    severity can be changed after loading, call reindex() afterwards so the
+    severity index follows.
+    
+    Attributes:
+        ID: Benchmark id from the XCCDF document
+        groups: array of StigGroup in document order
+    """
+    
+    def __init__(self, groups=(), id=None):
+        """Inits StigBenchmark with id and indexes the given groups
+    
+        Args:
+            groups: iterable of StigGroup
+            id: Benchmark id, e.g. Windows_7_STIG
+        """
+        self.ID = id
+        self.groups = []
+        self._by_group = {}
+        self._by_rule = {}
+        self._by_version = {}
+        self._by_ident = {}
+        self._by_severity = {}
+        for group in groups:
+            self.add_group(group)
+            
+    def add_group(self, group):
+        """Add a fully built StigGroup and index it and its rules
+    
+        Args:
+            group: StigGroup to add
+        
+        Returns:
+            True if successful
+        
+        Raises:
+            Exception if a group with the same ID was already added
+        """
+        if group.ID in self._by_group:
+            raise Exception('Duplicate StigGroup %s in StigBenchmark' % group.ID)
+        self.groups.append(group)
+        self._by_group[group.ID] = group
+        for _rule in group.rules:
+            self._index_rule(group, _rule)
+        return True
+        
+    def _index_rule(self, group, rule):
+        self._by_rule[rule.ID] = (group, rule)
+        self._by_version[rule.VERSION] = (group, rule)
+        if rule.IDENT is not None:
+            self._by_ident.setdefault(rule.IDENT.content, []).append(rule)
+        self._by_severity.setdefault(rule.severity, []).append(rule)
+        
+    def reindex(self):
+        """Rebuild the rule indexes, e.g. after rule severities changed"""
+        self._by_rule = {}
+        self._by_version = {}
+        self._by_ident = {}
+        self._by_severity = {}
+        for group in self.groups:
+            for _rule in group.rules:
+                self._index_rule(group, _rule)
+        return True
+        
+    def get_group(self, group_id):
+        """Return the StigGroup with this ID (e.g. V-1070), or None"""
+        return self._by_group.get(group_id)
+        
+    def get_rule(self, rule_id):
+        """Return the StigRule with this ID (e.g. SV-24996r1_rule), or None"""
+        return self._by_rule.get(rule_id, (None, None))[1]
+        
+    def get_group_for_rule(self, rule_id):
+        """Return the StigGroup holding the rule with this ID, or None"""
+        return self._by_rule.get(rule_id, (None, None))[0]
+        
+    def get_rule_by_version(self, version):
+        """Return the StigRule with this VERSION (e.g. 1.001), or None"""
+        return self._by_version.get(version, (None, None))[1]
+        
+    def find_by_ident(self, content):
+        """Return the list of StigRules whose IDENT content matches (e.g. a CCI)"""
+        return list(self._by_ident.get(content, []))
+        
+    def find_by_severity(self, severity):
+        """Return the list of StigRules with this severity"""
+        return list(self._by_severity.get(severity, []))
+        
+    def priorities(self, policy=None):
+        """Return a dict of rule ID to priority for every rule
+    
+        Args:
+            policy: PriorityPolicy to apply, defaults to the module wide one
+        """
+        if policy is None:
+            policy = _get_default_policy()
+        _rules = [x[1] for x in self._by_rule.values()]
+        return dict(zip((x.ID for x in _rules), policy.prioritize(_rules)))
+        
+    def __len__(self):
+        return len(self.groups)
+        
+    def __iter__(self):
+        return iter(self.groups)
+        
+        
+def _intern(value):
+    """Intern a string that repeats across rules so only one copy is kept"""
+    if value is None:
+        return None
+    return sys.intern(value)
+    
+    
 def parse_reference(ref):
     """Parse the XML element and build StigRefernce
     Args:
@@ -318,15 +457,15 @@ def parse_reference(ref):
             pass
         else:
             if x.nodeName == 'dc:title':
-                _title = x.firstChild.nodeValue
+                _title = _intern(x.firstChild.nodeValue)
             elif x.nodeName == 'dc:publisher':
-                _pub = x.firstChild.nodeValue
+                _pub = _intern(x.firstChild.nodeValue)
             elif x.nodeName == 'dc:type':
-                _type = x.firstChild.nodeValue
+                _type = _intern(x.firstChild.nodeValue)
             elif x.nodeName == 'dc:subject':
-                _subject = x.firstChild.nodeValue
+                _subject = _intern(x.firstChild.nodeValue)
             elif x.nodeName == 'dc:identifier':
-                _id = x.firstChild.nodeValue
+                _id = _intern(x.firstChild.nodeValue)
     
     _ret_ref = StigReference(_title, _pub, _type, _subject, _id)
     #Error check
@@ -383,8 +522,8 @@ def parse_check(checks):
             pass
         else:
             if x.nodeName == 'check-content-ref':
-                _href = x.getAttribute('href')
-                _name = x.getAttribute('name')
+                _href = _intern(x.getAttribute('href'))
+                _name = _intern(x.getAttribute('name'))
             if x.nodeName == 'check-content':
                 _content = x.firstChild.nodeValue       
     _tmp_check = StigCheck(_name, _sys, _href, _content)
@@ -415,8 +554,8 @@ def parse_rules(rules):
     _rule_fix = None
     _rule_check = []
     _rule_id = rules.getAttribute('id')
-    _rule_severity = rules.getAttribute('severity')
-    _rule_weight = rules.getAttribute('weight')
+    _rule_severity = _intern(rules.getAttribute('severity'))
+    _rule_weight = _intern(rules.getAttribute('weight'))
     _tmp_rule = None
     for x in rules.childNodes:
         if x.nodeType == 3:
@@ -431,7 +570,7 @@ def parse_rules(rules):
             elif x.nodeName == 'reference':
                 _rule_ref = parse_reference(x)
             elif x.nodeName == 'ident':
-                _rule_ident = StigIdent(x.getAttribute('id'), 
+                _rule_ident = StigIdent(_intern(x.getAttribute('id')), 
                                         x.firstChild.nodeValue)
             elif x.nodeName == 'fixtext':
                 _rule_fixtext = parse_fixtext(x)
@@ -452,160 +591,3099 @@ def parse_rules(rules):
     else:
         raise Exception('StigRule was not properly created')
 
-def f(x):
-    return {
-            'high': 1,
-            'medium': 2,
-            'low': 3
-            }[x]
-def g(x):
-    if x < 14 : return 1
-    elif x < 18 : return 2
-    elif x < 22 : return 3
-    elif x < 26 : return 4
-    else: return 5
-                
-def _json_to_jira(group, project, user, url):
-    """ Convirt from STIGGroup to JSON and then ship to Jira
+def parse_group(group):
+    """Parse a Group XML element and build the StigGroup with all its rules
+    
     Args:
-        groups: (StigGroup) Master list of all Requirements
-        project: string with jira recognized project ID
-        user: string with users jira username
-        url: string with url to Jira API required
+        group: an XML Element following the DISA Group schema
         
     Returns:
-        True is succeeded, False in not
+        a fully built StigGroup
     
     Raises:
-        AssertionErrors if passed vars are not of correct type.
+        Exception if a child Rule can not be parsed
     """
-    assert type(group) is StigGroup, "Passed Group is not type StigGroup: %r" % group
-    assert type(project) is str, "Passed Project is not a String: %r" % project
-    assert type(user) is str, "Passed user is not a String: %r" % user
-    assert type(url) is str, "Passed URL is not a String: %r" % url
+    _group_title = None
+    _group_description = None
+    _tmp_rules = []
+    _id = group.getAttribute('id')
+    for x in group.childNodes:
+        if x.nodeType == 3: #if node is a Text node
+            pass
+        else:
+            if x.nodeName == 'title': 
+                _group_title = x.firstChild.nodeValue
+            elif x.nodeName == 'description':
+                #mostly the same empty <GroupDescription> markup
+                _group_description = _intern(x.firstChild.nodeValue)
+            elif x.nodeName == 'Rule':
+                _tmp_rules.append(parse_rules(x))
+    _tmp_group = StigGroup(_id, _group_title, _group_description)
+    for i in _tmp_rules:
+        _tmp_group.add_rule(i)
+    return _tmp_group
+    
+    
+def parse_profile(profile):
+    """Parse a Profile XML element into the IDs it selects
+    
+    Args:
+        profile: an XML Element following the XCCDF Profile schema
         
-    #TODO (jasimmonsv) Grab group and dump into variables
-    if len(group.rules)>1: raise ValueError("More Rules in this Group then expected")
-    _rule = group.rules[0]
-    _calc = g(f(_rule.severity) * float(_rule.weight))
+    Returns:
+        set of the idrefs of every <select> with selected="true"
+    """
+    _selected = set()
+    for x in profile.childNodes:
+        if x.nodeType == 3:
+            pass
+        elif x.nodeName == 'select':
+            if x.getAttribute('selected') == 'true':
+                _selected.add(x.getAttribute('idref'))
+            else:
+                _selected.discard(x.getAttribute('idref'))
+    return _selected
     
-    _summary = group.ID+" "+group.TITLE
-    _priority = str(_calc)
-    _labels = [group.ID, _rule.ID]
-    _id = "7"
-    _assignee = "-1"
-    _env = ""
-    _desc = ""
     
-    _project = {"id":project}
-    _issuetype = {"id":_id}
-    _reporter = {"name":user}
-    _json_assignee = {"name": _assignee}
-    _json_priority = {"id":_priority}
+def iter_groups(xml_file, profile=None):
+    """Stream the XML document and yield each StigGroup as its Group closes
     
-    _desc = _rule.TITLE+"\n\n"+_rule.DESCRIPTION
+    Only one Group subtree is ever expanded into DOM nodes at a time, and it
+    is unlinked once the StigGroup has been built, so memory stays flat no
+    matter how large the benchmark is.
     
-    #Populate all variables into json structure
-    fields = {"project":_project, "summary":_summary, "issuetype":_issuetype,
-            "reporter": _reporter, "assignee":_json_assignee, "priority":_json_priority,
-            "labels":_labels, "environment":_env, "description":_desc 
-            }
-    _dict = [{"fields":fields}]
-    _data=json.dumps(_dict)
-    _headers = {"content-type": "application/json"}
-    _resp=requests.post(url=url, data=_data[1:-1], headers=_headers, auth=("jirasys","xxxxxxxx"))
-    _data = _resp.content
-    return True
+    When a profile is named its <select> list is read first (XCCDF puts 
+    every Profile ahead of the Groups) and Groups it does not select are 
+    stepped over without being expanded or parsed at all.
+    
+    Args:
+        xml_file: path (or open file) of a DISA XCCDF document
+        profile: optional Profile id, e.g. MAC-1_Classified
+        
+    Yields:
+        fully built StigGroup objects in document order
+    
+    Raises:
+        Exception if a Group can not be parsed or the profile is not found
+    """
+    _selected = None
+    _events = pulldom.parse(xml_file)
+    for _event, _node in _events:
+        if _event != pulldom.START_ELEMENT:
+            continue
+        if (_node.tagName == 'Profile' and profile is not None and 
+                _node.getAttribute('id') == profile):
+            _events.expandNode(_node)
+            _selected = parse_profile(_node)
+            _node.unlink()
+        elif _node.tagName == 'Group':
+            if profile is not None:
+                if _selected is None:
+                    raise Exception('Profile %s not found' % profile)
+                if _node.getAttribute('id') not in _selected:
+                    continue
+            _start = time.perf_counter()
+            _events.expandNode(_node)
+            #expat splits text on entity references, merge it back together
+            _node.normalize()
+            _tmp_group = parse_group(_node)
+            _node.unlink()
+            metrics.observe('parse_group_seconds', time.perf_counter() - _start)
+            metrics.incr('groups_parsed_total')
+            metrics.incr('rules_parsed_total', len(_tmp_group.rules))
+            yield _tmp_group
+            
+            
+GROUP_START = re.compile(rb'<Group\b[^>]*?\bid="([^"]*)"[^>]*>')
+GROUP_END = b'</Group>'
+_GROUP_TITLE = re.compile(rb'<title>([^<]*)</title>')
+_RULE_START = re.compile(rb'<Rule\b([^>]*)>')
+_ATTRIBUTE = re.compile(rb'([\w:-]+)="([^"]*)"')
+_ROOT_START = re.compile(rb'<([A-Za-z_][\w.:-]*)\b[^>]*>')
+LAZY_RULE_FIELDS = ('VERSION', 'TITLE', 'DESCRIPTION', 'REFERENCE', 'IDENT',
+                    'FIXTEXT', 'FIX', 'checks')
+
 
-def printToHTML(groups):
+class LazyStigGroup(StigGroup):
+    """A StigGroup that only holds its headers until more is asked for
+    
+    ID, TITLE and the ID, severity and weight of every rule are read 
+    straight from the XML text when the group is scanned. DESCRIPTION and the
+    heavy rule fields (see LAZY_RULE_FIELDS) are decoded the first time any
+    of them is read, by parsing the group's byte range of the source file
+    with parse_group.
+    
+    Attributes:
+        source: path of the XCCDF document the group is in
+        start: byte offset of the <Group> start tag
+        end: byte offset just past the </Group> end tag
+    """
+    __slots__ = ('source', 'start', 'end')
+    
+    def __init__(self, id, title, source, start, end):
+        self.ID = id
+        self.TITLE = title
+        self.rules = []
+        self.source = source
+        self.start = start
+        self.end = end
+        
+    def __getattr__(self, name):
+        #Only called for slots that have not been filled in yet
+        if name == 'DESCRIPTION':
+            self.materialize()
+            return object.__getattribute__(self, name)
+        raise AttributeError(name)
+        
+    def materialize(self):
+        """Decode the full group now, keeps changed rule severities/weights
+    
+        Returns:
+            True if successful
+    
+        Raises:
+            Exception if the byte range no longer holds this group
+        """
+        _group = read_group(self.source, self.start, self.end)
+        if _group.ID != self.ID or len(_group.rules) != len(self.rules):
+            raise Exception('Group %s moved in %s, rescan the file' % 
+                            (self.ID, self.source))
+        self.DESCRIPTION = _group.DESCRIPTION
+        for _lazy, _rule in zip(self.rules, _group.rules):
+            for _name in LAZY_RULE_FIELDS:
+                setattr(_lazy, _name, getattr(_rule, _name))
+        return True
+        
+        
+class LazyStigRule(StigRule):
+    """A StigRule holding only ID, severity and weight until more is read
+    
+    Reading any of LAZY_RULE_FIELDS materializes the whole owning group.
+    change_severity/change_weight work without decoding anything.
     """
+    __slots__ = ('_group',)
+    
+    def __init__(self, group, id, severity=DEF_SEVERITY, weight=DEF_WEIGHT):
+        self._group = group
+        self.ID = id
+        self.severity = severity
+        self._DISA_SEVERITY = severity
+        self.weight = weight
+        self._DISA_WEIGHT = weight
+        
+    def __getattr__(self, name):
+        if name in LAZY_RULE_FIELDS:
+            self._group.materialize()
+            return object.__getattribute__(self, name)
+        raise AttributeError(name)
+        
+        
+def _root_tag(xml_file, data):
+    """Return (start tag, end tag) of the document element, e.g. Benchmark
+    
+    The start tag carries the namespace declarations a Group slice needs to
+    be parsed on its own. It is read from data every time rather than 
+    cached by path, so a new release saved over the old file is picked up.
+    
     Args:
-        groups: Master list of all Requirements
+        xml_file: path of the document, for error messages
+        data: the document's bytes, usually a mmap
+    """
+    for _match in _ROOT_START.finditer(data):
+        if not _match.group(0).startswith((b'<?', b'<!')):
+            return _match.group(0), b'</' + _match.group(1) + b'>'
+    raise Exception('No root element in %s' % xml_file)
+    
+    
+def _unescape(value):
+    return _intern(html.unescape(value.decode('utf-8')))
+    
+    
+def _attributes(tag):
+    return dict((k.decode('utf-8'), html.unescape(v.decode('utf-8'))) 
+                for k, v in _ATTRIBUTE.findall(tag))
+                
+                
+def scan_groups(xml_file):
+    """Find the byte range of every Group without building any DOM
+    
+    DISA benchmarks keep their Groups flat (no Group inside a Group), 
+    which this relies on.
+    
+    Args:
+        xml_file: path of a DISA XCCDF document
         
     Returns:
-        True is succeeded, False in not
+        list of (group ID, start, end) where start is the offset of the
+        <Group> start tag and end the offset just past </Group>
+    """
+    with open(xml_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as _data:
+            return [(_match.group(1).decode('utf-8'), _match.start(), _end) 
+                    for _match, _end in _find_groups(xml_file, _data)]
+                    
+                    
+def _find_groups(xml_file, data):
+    """Yield (GROUP_START match, end offset) for every Group in data"""
+    _root_tag(xml_file, data)
+    _pos = 0
+    while True:
+        _match = GROUP_START.search(data, _pos)
+        if _match is None:
+            return
+        _end = data.find(GROUP_END, _match.end())
+        if _end < 0:
+            raise Exception('Unterminated Group %s in %s' % 
+                            (_match.group(1).decode('utf-8'), xml_file))
+        _end += len(GROUP_END)
+        yield _match, _end
+        _pos = _end
+        
+        
+def read_group(xml_file, start, end):
+    """Parse one Group out of a document by its byte range
+    
+    Args:
+        xml_file: path of a DISA XCCDF document
+        start: byte offset of the <Group> start tag
+        end: byte offset just past the </Group> end tag
+        
+    Returns:
+        fully built StigGroup
+    """
+    with open(xml_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as _data:
+            _open, _close = _root_tag(xml_file, _data)
+            return _parse_group_slice(_open, _data[start:end], _close)
+    
+    
+def _parse_group_slice(open_tag, data, close_tag):
+    _doc = parseString(b''.join((open_tag, data, close_tag)))
+    _tmp_group = parse_group(_doc.documentElement.getElementsByTagName('Group')[0])
+    _doc.unlink()
+    return _tmp_group
+    
+    
+def iter_lazy_groups(xml_file, profile=None):
+    """Yield a LazyStigGroup for every Group, decoding only their headers
+    
+    Args:
+        xml_file: path of a DISA XCCDF document
+        profile: optional Profile id, only the Groups it selects are yielded
+        
+    Yields:
+        LazyStigGroup objects in document order
     
     Raises:
-        N/A
+        Exception if the profile is not found
     """
-    with open('./results.'+str(start)+'.html','w') as f:
-        f.write('<html><body>')
-        for group in groups:
-            f.write(group.ID+"<br>")
-            f.write(group.TITLE+"<br>")
-            f.write(group.DESCRIPTION+"<br>")
-            for rule in group.rules:
-                f.write("****Rule****<br>")
-                f.write("ID: "+rule.ID+"<br>")
-                f.write("DISA Severity: "+rule._DISA_SEVERITY+"<br>")
-                f.write("Rule Severity: "+rule.severity+"<br>")
-                f.write("DISA Weight: "+rule._DISA_WEIGHT+"<br>")
-                f.write("Rule Weight: "+rule.weight+"<br>")
-                f.write("Version: "+rule.VERSION+"<br>")
-                f.write("Title: "+rule.TITLE+"<br>")
-                f.write("Description:<br>")
-                f.write("\t"+rule.DESCRIPTION+"<br>")
-                f.write("Reference:<br>")
-                f.write("\tRef Title:\t"+rule.REFERENCE.title+"<br>")
-                f.write("\tRef Publisher:\t"+rule.REFERENCE.publisher+"<br>")
-                f.write("\tRef Type:\t"+rule.REFERENCE.type+"<br>")
-                f.write("\tRef Subject:\t"+rule.REFERENCE.subject+"<br>")
-                f.write("\tRef Identifier:\t"+rule.REFERENCE.identifier+"<br>")
-                f.write("Ident: "+str(rule.IDENT)+"<br>")
-                f.write("Fixtext:<br>")
-                f.write("\tFixref: "+rule.FIXTEXT.fixref+"<br>")
-                f.write("\tContent: "+rule.FIXTEXT.content+"<br>")
-                f.write("Fix:<br>")
-                f.write("\tID:\t"+rule.FIX.fix_id+"<br>")
-                f.write("# Rule Checks:\t"+str(len(rule.checks))+"<br>")
-                f.write('*****************************<br>')
-        f.write('</body></html>')
-    f.closed
-    return True    
+    _selected = None
+    if profile is not None:
+        _selected = _scan_profile(xml_file, profile)
+    with open(xml_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as _data:
+            for _match, _end in _find_groups(xml_file, _data):
+                _id = _match.group(1).decode('utf-8')
+                if _selected is not None and _id not in _selected:
+                    continue
+                yield _group_headers(_id, _data[_match.end():_end], xml_file,
+                                     _match.start(), _end)
+                                     
+                                     
+def _group_headers(group_id, body, xml_file, start, end):
+    """Build a LazyStigGroup from the raw text between <Group> and </Group>"""
+    _rule = _RULE_START.search(body)
+    _title = _GROUP_TITLE.search(body, 0, len(body) if _rule is None else _rule.start())
+    _tmp_group = LazyStigGroup(group_id, _unescape(_title.group(1)) if _title else None,
+                               xml_file, start, end)
+    for _rule in _RULE_START.finditer(body):
+        _attrs = _attributes(_rule.group(1))
+        _tmp_group.add_rule(LazyStigRule(
+            _tmp_group, _attrs.get('id'), 
+            _intern(_attrs.get('severity', DEF_SEVERITY)),
+            _intern(_attrs.get('weight', DEF_WEIGHT))))
+    metrics.incr('groups_scanned_total')
+    return _tmp_group
+        
+        
+GROUP_INDEX_VERSION = 1
+
+
+class GroupIndex(object):
+    """Random access to single Groups of a large XCCDF document
     
-def main():
+    The byte range of every Group is kept in a side-car JSON file next to the
+    document (<xml_file>.idx by default), rebuilt with scan_groups whenever 
+    the document's size or modification time no longer match it. The 
+    document is memory-mapped once, and get() parses only the requested 
+    Group's slice through parse_group, so a fetch costs the same whatever
+    the size of the file. get() also notices a new release saved over the 
+    document and maps it again, along with its ranges and root tag.
+    
+    Attributes:
+        xml_file: path of the XCCDF document
+        path: path of the side-car index
+        ranges: dict of group ID to (start, end) byte offsets
     """
+    
+    def __init__(self, xml_file, path=None):
+        self.xml_file = xml_file
+        self.path = path if path is not None else xml_file + '.idx'
+        self._map()
+        
+    def _map(self):
+        """Map the document and load or rebuild its ranges"""
+        self._file = open(self.xml_file, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        _stat = os.fstat(self._file.fileno())
+        self._stamp = [_stat.st_size, _stat.st_mtime_ns]
+        self.ranges = self._load()
+        if self.ranges is None:
+            self.ranges = self.rebuild()
+        self._open, self._close = _root_tag(self.xml_file, self._data)
+        
+    def _refresh(self):
+        """Map the document again if the file on disk changed"""
+        try:
+            _stat = os.stat(self.xml_file)
+        except OSError:
+            return
+        if [_stat.st_size, _stat.st_mtime_ns] != self._stamp:
+            self.close()
+            self._map()
+        
+    def _load(self):
+        """Return the ranges from the side-car, None if it is missing or stale"""
+        try:
+            with open(self.path) as f:
+                _data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (_data.get('version') != GROUP_INDEX_VERSION or 
+                _data.get('stamp') != self._stamp):
+            return None
+        return dict((k, tuple(v)) for k, v in _data['groups'].items())
+        
+    def rebuild(self):
+        """Scan the document again and rewrite the side-car
+    
+        Returns:
+            dict of group ID to (start, end) byte offsets
+        """
+        _ranges = dict((_match.group(1).decode('utf-8'), (_match.start(), _end))
+                       for _match, _end in _find_groups(self.xml_file, self._data))
+        _tmp = self.path + '.tmp'
+        try:
+            with open(_tmp, 'w') as f:
+                json.dump({'version': GROUP_INDEX_VERSION, 'stamp': self._stamp,
+                           'groups': _ranges}, f)
+            os.replace(_tmp, self.path)
+        except OSError as e:
+            #A read-only location only costs a rescan next time
+            logging.warning('Could not write group index %s: %s', self.path, e)
+        self.ranges = _ranges
+        return _ranges
+        
+    def get(self, group_id):
+        """Parse and return the StigGroup with this ID, or None"""
+        self._refresh()
+        _range = self.ranges.get(group_id)
+        if _range is None:
+            return None
+        return _parse_group_slice(self._open, self._data[_range[0]:_range[1]], 
+                                  self._close)
+                                  
+    def close(self):
+        self._data.close()
+        self._file.close()
+        
+    def __contains__(self, group_id):
+        return group_id in self.ranges
+        
+    def __len__(self):
+        return len(self.ranges)
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *args):
+        self.close()
+        
+        
+def _scan_profile(xml_file, profile):
+    """Find one Profile by regex and parse only it with parse_profile"""
+    _pattern = re.compile(rb'<Profile\b[^>]*?\bid="' + 
+                          re.escape(profile.encode('utf-8')) + rb'"[^>]*>.*?</Profile>',
+                          re.DOTALL)
+    with open(xml_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as _data:
+            _open, _close = _root_tag(xml_file, _data)
+            _match = _pattern.search(_data)
+            if _match is None:
+                raise Exception('Profile %s not found' % profile)
+            _doc = parseString(b''.join((_open, _match.group(0), _close)))
+    _selected = parse_profile(_doc.documentElement.getElementsByTagName('Profile')[0])
+    _doc.unlink()
+    return _selected
+    
+    
+def read_groups(xml_file, profile=None, stream=True):
+    """Yield the StigGroups of a document, streamed unless asked otherwise
+    
+    Streaming with iter_groups keeps peak memory flat whatever the size of
+    the document. Loading the whole document with minidom is about 2.5x 
+    faster, but its peak memory grows with the file (about 8x its size), so
+    it is only used when stream is False. A profile is always streamed, so 
+    the Groups it does not select are skipped at parse time.
+    
     Args:
-        N/A
+        xml_file: path (or open file) of a DISA XCCDF document
+        profile: optional Profile id, e.g. MAC-1_Classified
+        stream: False to load the whole document with minidom instead,
+                ignored when a profile is given
+        
     Returns:
-        True or False
+        iterator of fully built StigGroup objects in document order
+    
     Raises:
+        Exception if a Group can not be parsed or the profile is not found
     """
-    doc = parse(XML_FILE)
-    group_title = None
-    group_description = None
-    _tmp_rules=[]
-    stig_groups=[]
-    groups = doc.getElementsByTagName('Group')
-    for node in groups:
-        _id = node.getAttribute('id')
-        for x in node.childNodes:
-            if x.nodeType == 3: #if node is a Text node
-                pass
-            else:
-                if x.nodeName == 'title': 
-                    group_title = x.firstChild.nodeValue
-                elif x.nodeName == 'description':
-                    group_description = x.firstChild.nodeValue
-                elif x.nodeName == 'Rule':
-                    _tmp_rules.append(parse_rules(x))
-        tmp_group = StigGroup(_id, group_title, group_description)
-        for i in _tmp_rules:
-            tmp_group.add_rule(i)
-        stig_groups.append(tmp_group) #append group only after fully built from xml
-        _id = None
-        group_title = None
-        group_description = None
-        group_rules = None
-        _tmp_rules=[]
-        tmp_group=None
-        i=None
-    for group in stig_groups:
-        _json_to_jira(group,
-                  "10108",      #Change this to specific Project Number
-                  "634273",     #Change to users Jira loging
-                  "http://jira.cmc.hl.com/rest/api/2/issue")
-    print("Done!")
+    if stream or profile is not None:
+        return iter_groups(xml_file, profile)
+    return _dom_groups(xml_file)
+    
+    
+def _dom_groups(xml_file):
+    """Whole document counterpart of iter_groups, see read_groups"""
+    with metrics.timer('parse_document_seconds'):
+        _doc = parse(xml_file)
+    try:
+        for _node in _doc.getElementsByTagName('Group'):
+            _start = time.perf_counter()
+            _tmp_group = parse_group(_node)
+            metrics.observe('parse_group_seconds', time.perf_counter() - _start)
+            metrics.incr('groups_parsed_total')
+            metrics.incr('rules_parsed_total', len(_tmp_group.rules))
+            yield _tmp_group
+    finally:
+        _doc.unlink()
+        
+        
+def benchmark_id(xml_file):
+    """Read the id of the root Benchmark element without parsing the rest
+    
+    Args:
+        xml_file: path of a DISA XCCDF document
+        
+    Returns:
+        the Benchmark id, None if the root element has none
+    """
+    with open(xml_file, 'rb') as f:
+        for _event, _node in pulldom.parse(f):
+            if _event == pulldom.START_ELEMENT:
+                return _node.getAttribute('id') or None
+    return None
+    
+    
+def load_benchmark(xml_file, cache_dir=None, profile=None):
+    """Parse a document into an indexed StigBenchmark
+    
+    Args:
+        xml_file: path of a DISA XCCDF document
+        cache_dir: go through the load_groups cache in this directory
+        profile: only load the groups this Profile id selects
+        
+    Returns:
+        StigBenchmark holding every (selected) group of the document
+    """
+    if cache_dir is not None:
+        _groups = load_groups(xml_file, cache_dir, profile=profile)
+    else:
+        _groups = read_groups(xml_file, profile)
+    return StigBenchmark(_groups, benchmark_id(xml_file))
+    
+    
+def _load_benchmark(xml_file, profile=None):
+    """Worker for parse_benchmarks, runs inside a pool process
+    
+    Args:
+        xml_file: path of a single XCCDF document
+        profile: only parse the groups this Profile id selects
+        
+    Returns:
+        tuple of the path, the list of StigGroups parsed from it and the 
+        to_dict() of the metrics collected while parsing it
+    """
+    #A pool process is reused across files and a forked one starts with a
+    #copy of the parent's metrics, only report what this file added
+    metrics.reset()
+    _groups = list(read_groups(xml_file, profile))
+    return xml_file, _groups, metrics.to_dict()
+    
+    
+def list_xml_files(paths):
+    """Expand directories in a list of paths to the XCCDF files they hold
+    
+    Args:
+        paths: list of file and directory paths
+        
+    Returns:
+        list of file paths, the .xml files of each directory sorted by name
+        and in place of the directory
+    """
+    _files = []
+    for _path in paths:
+        if os.path.isdir(_path):
+            _files.extend(sorted(os.path.join(_path, x) 
+                                 for x in os.listdir(_path) 
+                                 if x.lower().endswith('.xml')))
+        else:
+            _files.append(_path)
+    return _files
+    
+    
+def parse_benchmarks(xml_files, processes=None, profile=None):
+    """Parse many XCCDF documents in parallel worker processes
+    
+    Args:
+        xml_files: a directory holding XCCDF .xml files, a single file path,
+                   or a list of file paths
+        processes: number of worker processes, defaults to the CPU count
+        profile: only parse the groups this Profile id selects, in every file
+        
+    The parse metrics of every worker are merged into the module wide 
+    metrics.
+    
+    Returns:
+        dict mapping each file path to its list of StigGroups, in the order
+        the files were given (sorted by name when a directory is passed)
+    
+    Raises:
+        Exception if any of the documents can not be parsed
+    """
+    if isinstance(xml_files, str):
+        xml_files = [xml_files]
+    _files = list_xml_files(xml_files)
+    _benchmarks = {}
+    if len(_files) == 0:
+        return _benchmarks
+    with multiprocessing.Pool(min(processes or os.cpu_count(), len(_files))) as _pool:
+        _worker = functools.partial(_load_benchmark, profile=profile)
+        for _file, _groups, _metrics in _pool.imap(_worker, _files):
+            _benchmarks[_file] = _groups
+            metrics.merge(_metrics)
+    return _benchmarks
+    
+    
+def _file_digest(xml_file):
+    """sha256 hex digest of a file's content, read in 1MB chunks"""
+    _hash = hashlib.sha256()
+    with open(xml_file, 'rb') as f:
+        for _chunk in iter(lambda: f.read(1 << 20), b''):
+            _hash.update(_chunk)
+    return _hash.hexdigest()
+    
+    
+def load_groups(xml_file, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, 
+                profile=None):
+    """Load the StigGroups of a document, going through an on-disk cache
+    
+    The parsed groups are pickled under the content hash of the file and
+    PARSER_VERSION, so an unchanged file is loaded straight from the cache
+    while an edited file or a parser change misses it automatically. After
+    a miss the least recently used entries are evicted until the cache 
+    fits in max_bytes.
+    
+    Args:
+        xml_file: path of a DISA XCCDF document
+        cache_dir: directory holding the cache, created if missing
+        max_bytes: size the cache directory is trimmed down to
+        profile: only load the groups this Profile id selects, cached 
+                 separately from the full document
+        
+    Returns:
+        list of StigGroup in document order
+    
+    Raises:
+        Exception if the document can not be parsed
+    """
+    _key = _file_digest(xml_file)
+    if profile is not None:
+        _key = hashlib.sha256((_key + '\0' + profile).encode('utf-8')).hexdigest()
+    _path = os.path.join(cache_dir, '%s-v%d.pickle' % (_key, PARSER_VERSION))
+    try:
+        with open(_path, 'rb') as f:
+            _groups = pickle.load(f)
+        os.utime(_path)     #mark as recently used for eviction
+        return _groups
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.warning('Ignoring unreadable cache entry %s: %s', _path, e)
+    _groups = list(read_groups(xml_file, profile))
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    _tmp = '%s.%d.tmp' % (_path, os.getpid())
+    with open(_tmp, 'wb') as f:
+        pickle.dump(_groups, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(_tmp, _path)
+    _prune_cache(cache_dir, max_bytes)
+    return _groups
+    
+    
+def _prune_cache(cache_dir, max_bytes):
+    """Evict least recently used cache entries until under max_bytes"""
+    _entries = []
+    for x in os.listdir(cache_dir):
+        if x.endswith('.pickle'):
+            _stat = os.stat(os.path.join(cache_dir, x))
+            _entries.append((_stat.st_mtime, _stat.st_size, x))
+    _total = sum(x[1] for x in _entries)
+    for _mtime, _size, _name in sorted(_entries):
+        if _total <= max_bytes:
+            break
+        os.remove(os.path.join(cache_dir, _name))
+        _total -= _size
+        
+        
+class PriorityPolicy(object):
+    """Maps rule severity and weight to a Jira priority id
+    
+    A rule scores its severity rank times its weight, and the priority is 1
+    plus the number of thresholds at or below that score, so with the 
+    default policy a high severity rule of weight 10 scores 10 and gets 
+    priority 1. Every (severity, weight) pair is scored once and kept in a
+    lookup table, so prioritizing a whole benchmark costs a dict access per
+    rule. configure() swaps in a new policy and drops the table.
+    
+    Attributes:
+        severities: dict of severity to rank
+        thresholds: ascending tuple of score cut offs
+    """
+    
+    def __init__(self, severities=PRIORITY_SEVERITIES, thresholds=PRIORITY_THRESHOLDS):
+        self.configure(severities, thresholds)
+        
+    def configure(self, severities=None, thresholds=None):
+        """Change the policy, None keeps the current value
+    
+        Args:
+            severities: dict of severity to rank
+            thresholds: iterable of score cut offs
+        
+        Returns:
+            True if successful
+        """
+        if severities is not None:
+            self.severities = dict(severities)
+        if thresholds is not None:
+            self.thresholds = tuple(sorted(float(x) for x in thresholds))
+        self._table = {}
+        return True
+        
+    @classmethod
+    def load(cls, path):
+        """Build a policy from a JSON file with severities and thresholds keys"""
+        with open(path) as f:
+            _data = json.load(f)
+        return cls(_data.get('severities', PRIORITY_SEVERITIES), 
+                   _data.get('thresholds', PRIORITY_THRESHOLDS))
+                   
+    def to_dict(self):
+        return {'severities': dict(self.severities), 
+                'thresholds': list(self.thresholds)}
+        
+    def priority(self, severity, weight):
+        """Return the priority of one severity and weight
+    
+        Raises:
+            KeyError if the severity is not part of the policy
+        """
+        try:
+            return self._table[(severity, weight)]
+        except KeyError:
+            _score = self.severities[severity] * float(weight)
+            _priority = bisect.bisect_right(self.thresholds, _score) + 1
+            self._table[(severity, weight)] = _priority
+            return _priority
+            
+    def prioritize(self, rules):
+        """Return the priority of every rule, in order, in one pass
+    
+        Rules changed with change_severity/change_weight are looked up by
+        their current severity and weight.
+    
+        Args:
+            rules: iterable of StigRule
+        """
+        _table = self._table
+        _priorities = []
+        for _rule in rules:
+            _priority = _table.get((_rule.severity, _rule.weight))
+            if _priority is None:
+                _priority = self.priority(_rule.severity, _rule.weight)
+            _priorities.append(_priority)
+        return _priorities
+        
+        
+priority_policy = PriorityPolicy()
+
+
+def _get_default_policy():
+    """Return the module wide PriorityPolicy"""
+    return priority_policy
+    
+    
+class Metrics(object):
+    """Counters and latency histograms collected across a run
+    
+    Every stage of the pipeline reports into the module wide metrics 
+    instance: groups and rules parsed and the time each group took, payload
+    bytes sent, the latency of every HTTP attempt, retries, and final 
+    failures by status code. The result can be printed as a summary or 
+    dumped as JSON or as a Prometheus textfile. Safe to share between threads.
+    
+    Attributes:
+        buckets: upper bounds in seconds of the histogram buckets
+    """
+    buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 
+               5.0, 10.0)
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+        
+    def reset(self):
+        """Drop everything collected so far"""
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            
+    def incr(self, name, value=1, **labels):
+        """Add value to a counter, e.g. incr('http_failures_total', status=503)"""
+        _key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            _series = self._counters.setdefault(name, {})
+            _series[_key] = _series.get(_key, 0) + value
+            
+    def observe(self, name, seconds, **labels):
+        """Record one duration in a histogram"""
+        _key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        _index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            _series = self._histograms.setdefault(name, {})
+            _hist = _series.get(_key)
+            if _hist is None:
+                #one count per bucket plus +Inf, then sum
+                _hist = _series[_key] = [0] * (len(self.buckets) + 1) + [0.0]
+            _hist[_index] += 1
+            _hist[-1] += seconds
+            
+    def timer(self, name, **labels):
+        """Context manager observing the time spent inside it"""
+        return _MetricsTimer(self, name, labels)
+        
+    def counter(self, name, **labels):
+        """Current value of a counter, 0 if never incremented"""
+        _key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            return self._counters.get(name, {}).get(_key, 0)
+            
+    def to_dict(self):
+        """Everything collected, as plain JSON-able data"""
+        with self._lock:
+            _data = {"counters":{}, "histograms":{}}
+            for _name, _series in self._counters.items():
+                _data["counters"][_name] = [
+                    {"labels":dict(k), "value":v} for k, v in _series.items()]
+            for _name, _series in self._histograms.items():
+                _data["histograms"][_name] = [
+                    {"labels":dict(k), "buckets":list(self.buckets), 
+                     "counts":h[:-1], "count":sum(h[:-1]), "sum":h[-1]} 
+                    for k, h in _series.items()]
+        return _data
+        
+    def merge(self, data):
+        """Add the counters and histograms of another run's to_dict() output
+        
+        Used to fold in what worker processes collected, see parse_benchmarks.
+        
+        Raises:
+            Exception if a histogram was collected with different buckets
+        """
+        with self._lock:
+            for _name, _entries in data["counters"].items():
+                _series = self._counters.setdefault(_name, {})
+                for _entry in _entries:
+                    _key = tuple(sorted(_entry["labels"].items()))
+                    _series[_key] = _series.get(_key, 0) + _entry["value"]
+            for _name, _entries in data["histograms"].items():
+                _series = self._histograms.setdefault(_name, {})
+                for _entry in _entries:
+                    if tuple(_entry["buckets"]) != tuple(self.buckets):
+                        raise Exception('Can not merge %s, its buckets differ' % _name)
+                    _key = tuple(sorted(_entry["labels"].items()))
+                    _hist = _series.get(_key)
+                    if _hist is None:
+                        _hist = _series[_key] = [0] * (len(self.buckets) + 1) + [0.0]
+                    for i, _count in enumerate(_entry["counts"]):
+                        _hist[i] += _count
+                    _hist[-1] += _entry["sum"]
+                    
+    def summary(self):
+        """Human readable end of run summary"""
+        _data = self.to_dict()
+        _lines = []
+        for _name in sorted(_data["counters"]):
+            for _entry in _data["counters"][_name]:
+                _lines.append('%s%s: %s' % (_name, _format_labels(_entry["labels"]),
+                                            _entry["value"]))
+        for _name in sorted(_data["histograms"]):
+            for _entry in _data["histograms"][_name]:
+                _count = _entry["count"]
+                _lines.append('%s%s: count=%d total=%.3fs mean=%.4fs p50<=%s p99<=%s' % (
+                    _name, _format_labels(_entry["labels"]), _count, _entry["sum"],
+                    _entry["sum"] / _count if _count else 0.0,
+                    _bucket_quantile(_entry, 0.5), _bucket_quantile(_entry, 0.99)))
+        return '\n'.join(_lines)
+        
+    def write_json(self, path):
+        _tmp = path + '.tmp'
+        with open(_tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+        os.replace(_tmp, path)
+        
+    def write_prometheus(self, path, prefix='stig2jira_'):
+        """Write a textfile for the Prometheus node exporter, atomically"""
+        _data = self.to_dict()
+        _lines = []
+        for _name in sorted(_data["counters"]):
+            _lines.append('# TYPE %s%s counter' % (prefix, _name))
+            for _entry in _data["counters"][_name]:
+                _lines.append('%s%s%s %s' % (prefix, _name, 
+                                             _format_labels(_entry["labels"]),
+                                             _entry["value"]))
+        for _name in sorted(_data["histograms"]):
+            _lines.append('# TYPE %s%s histogram' % (prefix, _name))
+            for _entry in _data["histograms"][_name]:
+                _total = 0
+                for _le, _count in zip(list(self.buckets) + ['+Inf'], _entry["counts"]):
+                    _total += _count
+                    _labels = dict(_entry["labels"], le=_le)
+                    _lines.append('%s%s_bucket%s %d' % (prefix, _name, 
+                                                       _format_labels(_labels), _total))
+                _lines.append('%s%s_sum%s %s' % (prefix, _name, 
+                                                 _format_labels(_entry["labels"]),
+                                                 _entry["sum"]))
+                _lines.append('%s%s_count%s %d' % (prefix, _name, 
+                                                   _format_labels(_entry["labels"]),
+                                                   _entry["count"]))
+        _tmp = path + '.tmp'
+        with open(_tmp, 'w') as f:
+            f.write('\n'.join(_lines) + '\n')
+        os.replace(_tmp, path)
+        
+        
+class _MetricsTimer(object):
+    def __init__(self, metrics, name, labels):
+        self._metrics = metrics
+        self._name = name
+        self._labels = labels
+        
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+        
+    def __exit__(self, *args):
+        self._metrics.observe(self._name, time.perf_counter() - self._start,
+                              **self._labels)
+                              
+                              
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, labels[k]) for k in sorted(labels))
+    
+    
+def _bucket_quantile(entry, q):
+    """Upper bound of the bucket holding quantile q of a histogram entry"""
+    _target = q * entry["count"]
+    _seen = 0
+    for _le, _count in zip(entry["buckets"] + ['+Inf'], entry["counts"]):
+        _seen += _count
+        if _seen >= _target and _seen > 0:
+            return _le
+    return '+Inf'
+    
+    
+metrics = Metrics()
+
+
+def _get_default_metrics():
+    """Return the module wide Metrics instance"""
+    return metrics
+    
+    
+class JiraSession(requests.Session):
+    """A connection-pooled, keep-alive HTTP session for talking to Jira
+    
+    One JiraSession should be shared across a whole export run so every 
+    issue reuses an already open TCP/TLS connection instead of paying for a 
+    new handshake.
+    
+    Attributes:
+        timeout: default (connect, read) timeout applied to every request
+    """
+    timeout = JIRA_TIMEOUT
+    
+    def __init__(self, auth=JIRA_AUTH, pool_size=JIRA_POOL_SIZE, 
+                 keep_alive=True, timeout=JIRA_TIMEOUT):
+        """Inits JiraSession with auth, headers and a sized connection pool
+        
+        Args:
+            auth: (user, password) tuple sent with every request
+            pool_size: max number of connections kept open per host
+            keep_alive: set False to close the connection after each request
+            timeout: (connect, read) timeout in seconds, or a single number
+        """
+        requests.Session.__init__(self)
+        self.auth = auth
+        self.timeout = timeout
+        self.headers.update({"content-type": "application/json"})
+        if not keep_alive:
+            self.headers["Connection"] = "close"
+        _adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                 pool_maxsize=pool_size)
+        self.mount('http://', _adapter)
+        self.mount('https://', _adapter)
+        
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return requests.Session.request(self, method, url, **kwargs)
+        
+        
+class JiraScheduler(object):
+    """Retry and pacing policy for requests sent to Jira
+    
+    Throttled (429) and unavailable (502/503/504) responses and connection 
+    errors are retried with jittered exponential backoff, honoring any 
+    Retry-After header Jira sends. Requests that are not idempotent, such as
+    the POST creating an issue, are only retried when Jira can not have
+    acted on them: a 429, a 503 or a connection that was never opened. A 
+    read timeout, dropped connection, 502 or 504 may come after the issue
+    was created, and retrying those would create it twice. Every 429 also 
+    widens the minimum gap between request starts, and every success 
+    narrows it again, so the request rate settles just under what the server
+    will accept. A single scheduler is safe to share between threads.
+    
+    Attributes:
+        max_retries: retries allowed after the first attempt
+        base_delay: backoff for the first retry in seconds, doubled each time
+        max_delay: ceiling for any single backoff or pacing gap in seconds
+        interval: current minimum gap in seconds between request starts
+        retries: total number of retries performed
+        outcomes: dict of key to (final status code or error, attempts)
+        metrics: Metrics that latency, retries and failures are reported to
+    """
+    RETRY_STATUS = (429, 502, 503, 504)
+    UNSENT_STATUS = (429, 503)      #safe to retry even if not idempotent
+    
+    def __init__(self, max_retries=JIRA_MAX_RETRIES, base_delay=0.5, 
+                 max_delay=60.0, metrics=None):
+        self.max_retries = max_retries
+        if metrics is None:
+            metrics = _get_default_metrics()
+        self.metrics = metrics
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.interval = 0.0
+        self.retries = 0
+        self.outcomes = {}
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+        
+    def post(self, session, url, data, key=None, idempotent=False):
+        """Post through session, see request"""
+        return self.request(session, 'POST', url, data, key, idempotent)
+        
+    def request(self, session, method, url, data, key=None, idempotent=None):
+        """Send through session, retrying until success or retries run out
+        
+        Args:
+            session: JiraSession (or anything with requests style post/put)
+            method: HTTP method, 'POST' or 'PUT'
+            url: string with url to Jira API required
+            data: request body
+            key: optional name the final outcome is recorded under
+            idempotent: whether sending twice is harmless, which allows every
+                        retry. Defaults to True for anything but POST
+            
+        Returns:
+            the last response received
+            
+        Raises:
+            the last connection error if no response was ever received
+        """
+        _send = getattr(session, method.lower())
+        if idempotent is None:
+            idempotent = method.upper() != 'POST'
+        _retry_status = self.RETRY_STATUS if idempotent else self.UNSENT_STATUS
+        self.metrics.incr('payload_bytes_total', len(data or ''), method=method)
+        _attempt = 0
+        while True:
+            self._pace()
+            _wait = None
+            _start = time.perf_counter()
+            try:
+                _resp = _send(url=url, data=data)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.observe('http_request_seconds', 
+                                     time.perf_counter() - _start, method=method)
+                self.metrics.incr('http_responses_total', method=method, 
+                                  status=type(e).__name__)
+                if _attempt >= self.max_retries or not (idempotent or _unsent(e)):
+                    self._record(key, type(e).__name__, _attempt + 1)
+                    self.metrics.incr('http_failures_total', 
+                                      status=type(e).__name__)
+                    raise
+            else:
+                self.metrics.observe('http_request_seconds', 
+                                     time.perf_counter() - _start, method=method)
+                self.metrics.incr('http_responses_total', method=method, 
+                                  status=_resp.status_code)
+                self._adapt(_resp.status_code)
+                if (_resp.status_code not in _retry_status or 
+                        _attempt >= self.max_retries):
+                    self._record(key, _resp.status_code, _attempt + 1)
+                    if not 200 <= _resp.status_code < 300:
+                        self.metrics.incr('http_failures_total', 
+                                          status=_resp.status_code)
+                    return _resp
+                _wait = self._retry_after(_resp)
+            if _wait is None:
+                _wait = self._backoff(_attempt)
+            _attempt += 1
+            with self._lock:
+                self.retries += 1
+            self.metrics.incr('http_retries_total')
+            time.sleep(_wait)
+            
+    def _pace(self):
+        """Sleep until this request is allowed to start"""
+        with self._lock:
+            _now = time.time()
+            _start = max(_now, self._next_start)
+            self._next_start = _start + self.interval
+        if _start > _now:
+            time.sleep(_start - _now)
+            
+    def _adapt(self, status):
+        """Widen the pacing gap on a 429 and narrow it on anything else"""
+        with self._lock:
+            if status == 429:
+                self.interval = min(self.max_delay, 
+                                    max(self.interval * 2, self.base_delay / 10))
+            else:
+                self.interval *= 0.9
+                if self.interval < 0.001:
+                    self.interval = 0.0
+                    
+    def _backoff(self, attempt):
+        """Full jitter exponential backoff for the given retry number"""
+        return random.uniform(0, min(self.max_delay, 
+                                     self.base_delay * (2 ** attempt)))
+                                     
+    def _retry_after(self, resp):
+        """Seconds to wait from a Retry-After header, None if absent"""
+        _value = resp.headers.get('Retry-After')
+        if _value is None:
+            return None
+        try:
+            _wait = float(_value)
+        except ValueError:
+            try:
+                _when = email.utils.parsedate_to_datetime(_value)
+            except (TypeError, ValueError):
+                return None
+            _wait = _when.timestamp() - time.time()
+        #Small jitter so parallel workers do not all come back at once
+        return min(self.max_delay, max(0.0, _wait)) + random.uniform(0, 0.1)
+        
+    def _record(self, key, outcome, attempts):
+        if key is not None:
+            with self._lock:
+                self.outcomes[key] = (outcome, attempts)
+                
+                
+def _unsent(error):
+    """True if a requests exception means the request never reached Jira"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.Timeout):
+        return False
+    _reason = getattr(error.args[0], 'reason', None) if error.args else None
+    #NewConnectionError (refused, unresolvable) is a ConnectTimeoutError
+    return isinstance(_reason, urllib3.exceptions.ConnectTimeoutError)
+    
+    
+def _get_default_scheduler():
+    """Return the module wide JiraScheduler, creating it on first use"""
+    global _default_scheduler
+    if _default_scheduler is None:
+        _default_scheduler = JiraScheduler()
+    return _default_scheduler
+    
+    
+def _get_default_session():
+    """Return the module wide JiraSession, creating it on first use"""
+    global _default_session
+    if _default_session is None:
+        _default_session = JiraSession()
+    return _default_session
+    
+    
+class ExportJournal(object):
+    """Append-only record of per-group export outcomes
+    
+    One JSON object per line is appended and flushed as soon as each group
+    is exported, so a crashed or interrupted run leaves behind an exact 
+    record of what already made it into Jira. Reopening the journal lets a
+    new run skip those groups and only do the remaining work.
+    
+    Attributes:
+        path: file the journal is appended to
+        completed: dict of group ID to issue key for every group that was
+                   successfully exported by this or an earlier run
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.completed = {}
+        self._lock = threading.Lock()
+        _line = "\n"
+        if os.path.exists(path):
+            with open(path) as f:
+                for _line in f:
+                    try:
+                        _entry = json.loads(_line)
+                    except ValueError:
+                        #A line cut short by a crash, that group is redone
+                        continue
+                    if _entry.get("ok"):
+                        self.completed[_entry["group"]] = _entry.get("key")
+        self._file = open(path, 'a')
+        if not _line.endswith("\n"):
+            self._file.write("\n")
+        
+    def record(self, group_id, ok, status=None, key=None):
+        """Append the outcome of exporting one group
+        
+        Args:
+            group_id: ID of the exported StigGroup
+            ok: True if the issue was created
+            status: HTTP status or error Jira reported
+            key: issue key Jira assigned, if any
+        """
+        _line = json.dumps({"group":group_id, "ok":ok, "status":status, 
+                            "key":key, "time":time.time()})
+        with self._lock:
+            self._file.write(_line + "\n")
+            self._file.flush()
+            if ok:
+                self.completed[group_id] = key
+                
+    def pending(self, groups):
+        """Yield only the groups that have not been exported yet
+        
+        Args:
+            groups: iterable of StigGroup
+        """
+        for group in groups:
+            if group.ID not in self.completed:
+                yield group
+                
+    def close(self):
+        self._file.close()
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *args):
+        self.close()
+        
+        
+def _group_to_fields(group, project, user, policy=None):
+    """ Build the Jira issue fields for a single STIGGroup
+    Args:
+        group: (StigGroup) group holding a single rule
+        project: string with jira recognized project ID
+        user: string with users jira username
+        policy: PriorityPolicy picking the issue priority, defaults to the
+                module wide one
+        
+    Returns:
+        dict of Jira issue fields ready to be wrapped in {"fields": ...}
+    
+    Raises:
+        AssertionErrors if passed vars are not of correct type.
+        ValueError if the group holds more than one rule
+    """
+    assert isinstance(group, StigGroup), "Passed Group is not type StigGroup: %r" % group
+    assert type(project) is str, "Passed Project is not a String: %r" % project
+    assert type(user) is str, "Passed user is not a String: %r" % user
+        
+    #TODO (jasimmonsv) Grab group and dump into variables
+    if len(group.rules)>1: raise ValueError("More Rules in this Group then expected")
+    _rule = group.rules[0]
+    if policy is None:
+        policy = _get_default_policy()
+    _calc = policy.priority(_rule.severity, _rule.weight)
+    
+    _summary = group.ID+" "+group.TITLE
+    _priority = str(_calc)
+    _labels = [group.ID, _rule.ID]
+    _id = "7"
+    _assignee = "-1"
+    _env = ""
+    _desc = ""
+    
+    _project = {"id":project}
+    _issuetype = {"id":_id}
+    _reporter = {"name":user}
+    _json_assignee = {"name": _assignee}
+    _json_priority = {"id":_priority}
+    
+    _desc = _rule.TITLE+"\n\n"+_rule.DESCRIPTION
+    
+    #Populate all variables into json structure
+    fields = {"project":_project, "summary":_summary, "issuetype":_issuetype,
+            "reporter": _reporter, "assignee":_json_assignee, "priority":_json_priority,
+            "labels":_labels, "environment":_env, "description":_desc 
+            }
+    return fields
+    
+    
+def _json_to_jira(group, project, user, url, session=None, scheduler=None,
+                  journal=None):
+    """ Convirt from STIGGroup to JSON and then ship to Jira
+    Args:
+        groups: (StigGroup) Master list of all Requirements
+        project: string with jira recognized project ID
+        user: string with users jira username
+        url: string with url to Jira API required
+        session: JiraSession to post through, defaults to a shared session
+        scheduler: JiraScheduler handling retries, defaults to a shared one.
+                   The final outcome is recorded under the group ID
+        journal: optional ExportJournal the outcome is appended to
+        
+    Returns:
+        True is succeeded, False in not
+    
+    Raises:
+        AssertionErrors if passed vars are not of correct type.
+    """
+    assert type(url) is str, "Passed URL is not a String: %r" % url
+    _data = json.dumps({"fields":_group_to_fields(group, project, user)})
+    return _post_payload(_data, group.ID, url, session, scheduler, journal)
+    
+    
+def _post_payload(data, key, url, session=None, scheduler=None, journal=None):
+    """ Post one already encoded issue payload to Jira
+    Args:
+        data: JSON encoded {"fields": ...} issue payload
+        key: group ID the outcome is recorded under
+        url: string with url to Jira API required
+        session: JiraSession to post through, defaults to a shared session
+        scheduler: JiraScheduler handling retries, defaults to a shared one
+        journal: optional ExportJournal the outcome is appended to
+        
+    Returns:
+        True is succeeded, False in not
+    """
+    if session is None:
+        session = _get_default_session()
+    if scheduler is None:
+        scheduler = _get_default_scheduler()
+    _resp = scheduler.post(session, url, data, key)
+    _ok = 200 <= _resp.status_code < 300
+    if journal is not None:
+        _key = None
+        if _ok:
+            try:
+                _key = _resp.json().get("key")
+            except ValueError:
+                pass
+        journal.record(key, _ok, _resp.status_code, _key)
+    return _ok
+    
+    
+def _bulk_to_jira(groups, project, user, url, batch_size=JIRA_BULK_SIZE, 
+                  session=None, scheduler=None, journal=None):
+    """ Ship many STIGGroups to Jira through the bulk issue endpoint
+    Args:
+        groups: iterable of StigGroup
+        project: string with jira recognized project ID
+        user: string with users jira username
+        url: string with url to the Jira bulk API (/rest/api/2/issue/bulk)
+        batch_size: number of issues sent in each bulk request
+        session: JiraSession to post through, defaults to a shared session
+        scheduler: JiraScheduler handling retries, defaults to a shared one
+        journal: optional ExportJournal each batch's outcomes are appended to
+        
+    Returns:
+        tuple of two dicts, (created, failed). created maps group ID to the 
+        new issue key and failed maps group ID to the error Jira reported
+    
+    Raises:
+        AssertionErrors if passed vars are not of correct type.
+    """
+    assert type(url) is str, "Passed URL is not a String: %r" % url
+    assert batch_size > 0, "Batch size must be positive: %r" % batch_size
+    if session is None:
+        session = _get_default_session()
+    if scheduler is None:
+        scheduler = _get_default_scheduler()
+    _created = {}
+    _failed = {}
+    _batch = []
+    for group in groups:
+        _batch.append(group)
+        if len(_batch) == batch_size:
+            _post_bulk(_batch, project, user, url, session, scheduler, 
+                       _created, _failed)
+            _journal_batch(journal, _batch, _created, _failed)
+            _batch = []
+    if len(_batch) > 0:
+        _post_bulk(_batch, project, user, url, session, scheduler, 
+                   _created, _failed)
+        _journal_batch(journal, _batch, _created, _failed)
+    return _created, _failed
+    
+    
+def _journal_batch(journal, batch, created, failed):
+    """Append the outcome of every group in a bulk batch to the journal"""
+    if journal is None:
+        return
+    for group in batch:
+        if group.ID in created:
+            journal.record(group.ID, True, key=created[group.ID])
+        else:
+            journal.record(group.ID, False, failed.get(group.ID))
+    
+    
+def _post_bulk(batch, project, user, url, session, scheduler, created, failed):
+    """ Post one bulk request and sort its results by group ID
+    Args:
+        batch: list of StigGroup sent in this request
+        project: string with jira recognized project ID
+        user: string with users jira username
+        url: string with url to the Jira bulk API
+        session: JiraSession to post through
+        scheduler: JiraScheduler handling retries
+        created: dict of group ID to issue key, updated in place
+        failed: dict of group ID to error, updated in place
+    """
+    _updates = [{"fields":_group_to_fields(x, project, user)} for x in batch]
+    _resp = scheduler.post(session, url, json.dumps({"issueUpdates":_updates}))
+    try:
+        _body = _resp.json()
+    except ValueError:
+        _body = {}
+    if not isinstance(_body, dict):
+        _body = {}
+    _errors = {}
+    if isinstance(_body.get("errors"), list):
+        for _err in _body["errors"]:
+            _errors[_err.get("failedElementNumber")] = _err.get("elementErrors", _err)
+    if len(_errors) == 0 and "issues" not in _body:
+        #The whole request was rejected, nothing in the batch was created. 
+        #Jira then answers with an ErrorCollection, whose errors is a dict
+        _reason = "HTTP %s" % _resp.status_code
+        if _body.get("errors") or _body.get("errorMessages"):
+            _reason = "HTTP %s: %s" % (_resp.status_code, json.dumps(_body))
+        for group in batch:
+            failed[group.ID] = _reason
+        return
+    #Jira lists the created issues in request order, skipping failed elements
+    _issues = iter(_body.get("issues", []))
+    for i, group in enumerate(batch):
+        if i in _errors:
+            failed[group.ID] = _errors[i]
+        else:
+            _issue = next(_issues, None)
+            if _issue is None:
+                failed[group.ID] = "HTTP %s" % _resp.status_code
+            else:
+                created[group.ID] = _issue.get("key")
+                
+                
+def _async_to_jira(groups, project, user, url, concurrency=JIRA_CONCURRENCY,
+                   session=None, scheduler=None, journal=None):
+    """ Ship STIGGroups to Jira with a bounded number of requests in flight
+    Args:
+        groups: iterable of StigGroup, consumed lazily as slots free up
+        project: string with jira recognized project ID
+        user: string with users jira username
+        url: string with url to Jira API required
+        concurrency: max number of issue creations in flight at once
+        session: JiraSession to post through, by default a session with a
+                 pool sized to the concurrency is opened for the run
+        scheduler: JiraScheduler shared by all workers, so a 429 seen by one
+                   slows down all of them. Defaults to a shared one
+        journal: optional ExportJournal outcomes are appended to as they land
+        
+    Returns:
+        dict mapping each group ID to the result of _json_to_jira, or to the
+        exception raised while exporting that group
+    
+    Raises:
+        AssertionErrors if passed vars are not of correct type.
+    """
+    assert concurrency > 0, "Concurrency must be positive: %r" % concurrency
+    _items = ((group.ID, group) for group in groups)
+    if session is None:
+        with JiraSession(pool_size=concurrency) as _session:
+            _export = functools.partial(_json_to_jira, project=project, 
+                                        user=user, url=url, session=_session,
+                                        scheduler=scheduler, journal=journal)
+            return asyncio.run(_export_async(_items, _export, concurrency))
+    _export = functools.partial(_json_to_jira, project=project, user=user, 
+                                url=url, session=session, scheduler=scheduler,
+                                journal=journal)
+    return asyncio.run(_export_async(_items, _export, concurrency))
+                                     
+                                     
+async def _export_async(items, export, concurrency):
+    """ Run export over items with at most concurrency calls in flight
+    Args:
+        items: iterable of (key, item) tuples, consumed lazily as slots free up
+        export: blocking callable taking a single item, run in a thread
+        concurrency: max number of export calls in flight at once
+        
+    Returns:
+        dict mapping each key to what export returned, or to the exception
+        it raised
+    """
+    _loop = asyncio.get_running_loop()
+    _slots = asyncio.Semaphore(concurrency)
+    _results = {}
+    _tasks = []
+    
+    async def _export_one(key, item):
+        try:
+            _results[key] = await _loop.run_in_executor(_executor, export, item)
+        except Exception as e:
+            _results[key] = e
+        finally:
+            _slots.release()
+            
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as _executor:
+        for _key, _item in items:
+            #Wait for a free slot before pulling the next item off the iterator
+            await _slots.acquire()
+            _tasks.append(asyncio.ensure_future(_export_one(_key, _item)))
+        await asyncio.gather(*_tasks)
+    return _results
+    
+    
+def iter_payloads(groups, project, user):
+    """ Build the Jira issue payload of every group without touching the network
+    Args:
+        groups: iterable of StigGroup
+        project: string with jira recognized project ID
+        user: string with users jira username
+        
+    Yields:
+        (group ID, JSON encoded {"fields": ...} payload) tuples. The payload
+        is exactly what _json_to_jira would post for the group
+    """
+    for group in groups:
+        yield group.ID, json.dumps({"fields":_group_to_fields(group, project, user)})
+        
+        
+def write_payloads(groups, output, project, user, buffer_size=REPORT_BUFFER_SIZE):
+    """ Dry run export, write one Jira issue payload per line (NDJSON)
+    Args:
+        groups: iterable of StigGroup, consumed lazily
+        output: path of the file to write, '-' for stdout, or an open text
+                file object
+        project: string with jira recognized project ID
+        user: string with users jira username
+        buffer_size: write buffer used when output is a path
+        
+    Returns:
+        number of payloads written
+    """
+    if output == '-':
+        return _write_payloads(groups, sys.stdout, project, user)
+    if isinstance(output, str):
+        with open(output, 'w', encoding='utf-8', newline='\n',
+                  buffering=buffer_size) as f:
+            return _write_payloads(groups, f, project, user)
+    return _write_payloads(groups, output, project, user)
+    
+    
+def _write_payloads(groups, out, project, user):
+    _count = 0
+    for _key, _data in iter_payloads(groups, project, user):
+        out.write(_data)
+        out.write('\n')
+        _count += 1
+    return _count
+    
+    
+def read_payloads(source):
+    """ Read back a file written by write_payloads
+    Args:
+        source: path of the NDJSON file, '-' for stdin, or an open text file
+        
+    Yields:
+        (group ID, JSON encoded payload) tuples, the group ID being the first
+        label of the issue. Blank lines are skipped
+        
+    Raises:
+        Exception if a line is not a Jira issue payload
+    """
+    if source == '-':
+        yield from _read_payloads(sys.stdin)
+    elif isinstance(source, str):
+        with open(source, encoding='utf-8') as f:
+            yield from _read_payloads(f)
+    else:
+        yield from _read_payloads(source)
+        
+        
+def _read_payloads(lines):
+    for _num, _line in enumerate(lines, 1):
+        _line = _line.strip()
+        if not _line:
+            continue
+        try:
+            _key = json.loads(_line)["fields"]["labels"][0]
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise Exception('Line %s is not a Jira issue payload' % _num)
+        yield _key, _line
+        
+        
+def upload_payloads(payloads, url, concurrency=1, session=None, scheduler=None,
+                    journal=None):
+    """ Replay payloads produced by iter_payloads/write_payloads into Jira
+    Args:
+        payloads: iterable of (group ID, JSON encoded payload), e.g. from 
+                  read_payloads
+        url: string with url to Jira API required
+        concurrency: max number of issue creations in flight at once
+        session: JiraSession to post through, by default a session with a
+                 pool sized to the concurrency is opened for the run
+        scheduler: JiraScheduler handling retries, defaults to a shared one
+        journal: optional ExportJournal outcomes are appended to
+        
+    Returns:
+        dict mapping each group ID to True or False, or to the exception 
+        raised while uploading it
+    
+    Raises:
+        AssertionErrors if passed vars are not of correct type.
+    """
+    assert type(url) is str, "Passed URL is not a String: %r" % url
+    assert concurrency > 0, "Concurrency must be positive: %r" % concurrency
+    if session is None:
+        with JiraSession(pool_size=max(JIRA_POOL_SIZE, concurrency)) as _session:
+            return upload_payloads(payloads, url, concurrency, _session, 
+                                   scheduler, journal)
+    if concurrency == 1:
+        _results = {}
+        for _key, _data in payloads:
+            try:
+                _results[_key] = _post_payload(_data, _key, url, session, 
+                                               scheduler, journal)
+            except requests.RequestException as e:
+                _results[_key] = e
+        return _results
+    _items = ((_key, (_data, _key)) for _key, _data in payloads)
+    _export = lambda item: _post_payload(item[0], item[1], url, session, 
+                                         scheduler, journal)
+    return asyncio.run(_export_async(_items, _export, concurrency))
+    
+    
+def _jql_quote(value):
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+    
+    
+def search_labels(labels, project, url, session=None, scheduler=None, 
+                  page_size=JIRA_SEARCH_PAGE):
+    """ Find the issues of a project carrying any of the given labels
+    
+    One JQL search (labels in (...)) is posted for the whole batch and 
+    followed page by page until every match has been read.
+    
+    Args:
+        labels: list of labels, e.g. group IDs
+        project: string with jira recognized project ID
+        url: string with url to the Jira search API (/rest/api/2/search)
+        session: JiraSession to post through, defaults to a shared session
+        scheduler: JiraScheduler handling retries, defaults to a shared one
+        page_size: maxResults asked for per page, Jira may cap it lower
+        
+    Returns:
+        dict of label to issue key, for the requested labels only
+    
+    Raises:
+        Exception if a search page fails
+    """
+    assert type(url) is str, "Passed URL is not a String: %r" % url
+    if session is None:
+        session = _get_default_session()
+    if scheduler is None:
+        scheduler = _get_default_scheduler()
+    _wanted = set(labels)
+    _found = {}
+    if not _wanted:
+        return _found
+    _jql = 'project = %s AND labels in (%s)' % (
+        _jql_quote(project), ', '.join(_jql_quote(x) for x in sorted(_wanted)))
+    _start = 0
+    while True:
+        _resp = scheduler.post(session, url, json.dumps({
+            "jql": _jql, "startAt": _start, "maxResults": page_size, 
+            "fields": ["labels"]}), idempotent=True)
+        if not 200 <= _resp.status_code < 300:
+            raise Exception('Jira search failed with HTTP %s' % _resp.status_code)
+        _body = _resp.json()
+        _issues = _body.get("issues", [])
+        for _issue in _issues:
+            for _label in _issue.get("fields", {}).get("labels", []):
+                if _label in _wanted:
+                    _found.setdefault(_label, _issue.get("key"))
+        _start += len(_issues)
+        metrics.incr('jira_search_pages_total')
+        if len(_issues) == 0 or _start >= _body.get("total", 0):
+            return _found
+            
+            
+def iter_missing(groups, project, url, session=None, scheduler=None, 
+                 existing=None, batch_size=JIRA_SEARCH_BATCH, 
+                 page_size=JIRA_SEARCH_PAGE):
+    """ Pass on only the groups that have no Jira issue yet
+    
+    Groups are looked up batch_size at a time by their group ID label (the
+    first label _json_to_jira sets), so a whole benchmark costs a handful of
+    searches instead of one per group.
+    
+    Args:
+        groups: iterable of StigGroup, consumed lazily
+        project: string with jira recognized project ID
+        url: string with url to the Jira search API (/rest/api/2/search)
+        session: JiraSession to post through, defaults to a shared session
+        scheduler: JiraScheduler handling retries, defaults to a shared one
+        existing: optional dict filled in with group ID to issue key for 
+                  every group that already has an issue
+        batch_size: labels per search
+        page_size: maxResults asked for per page
+        
+    Yields:
+        the StigGroups with no issue, in input order
+    """
+    if existing is None:
+        existing = {}
+    _batch = []
+    for group in groups:
+        _batch.append(group)
+        if len(_batch) == batch_size:
+            yield from _missing_in(_batch, project, url, session, scheduler,
+                                   existing, page_size)
+            _batch = []
+    if len(_batch) > 0:
+        yield from _missing_in(_batch, project, url, session, scheduler, 
+                               existing, page_size)
+                               
+                               
+def _missing_in(batch, project, url, session, scheduler, existing, page_size):
+    _found = search_labels([x.ID for x in batch], project, url, session, 
+                           scheduler, page_size)
+    existing.update(_found)
+    for group in batch:
+        if group.ID not in _found:
+            yield group
+            
+            
+def fingerprint_rule(rule):
+    """Hash the content of a StigRule that ends up in Jira
+    
+    Args:
+        rule: StigRule to fingerprint
+        
+    Returns:
+        hex sha256 digest over TITLE, DESCRIPTION, FIXTEXT, checks, severity
+        and weight. Equal content always gives an equal fingerprint
+    """
+    _parts = [rule.TITLE, rule.DESCRIPTION, rule.severity, rule.weight]
+    if rule.FIXTEXT is not None:
+        _parts.extend([rule.FIXTEXT.fixref, rule.FIXTEXT.content])
+    for _check in rule.checks:
+        _parts.extend([_check.SYSTEM, _check.NAME, _check.HREF, _check.CONTENT])
+    return _digest(_parts)
+    
+    
+def _digest(parts):
+    """hex sha256 over a sequence of values, None hashed as empty"""
+    _hash = hashlib.sha256()
+    for _part in parts:
+        #Length prefix every field so ("ab", "c") and ("a", "bc") differ
+        _value = str(_part if _part is not None else '').encode('utf-8')
+        _hash.update(str(len(_value)).encode('ascii') + b':' + _value)
+    return _hash.hexdigest()
+    
+    
+def fingerprint_group(group):
+    """Hash the content of a StigGroup and all of its rules
+    
+    Args:
+        group: StigGroup to fingerprint
+        
+    Returns:
+        hex sha256 digest, see fingerprint_rule
+    """
+    _hash = hashlib.sha256()
+    for _value in (group.ID, group.TITLE):
+        _hash.update(str(_value if _value is not None else '').encode('utf-8') + b'\0')
+    for _rule in group.rules:
+        _hash.update(fingerprint_rule(_rule).encode('ascii'))
+    return _hash.hexdigest()
+    
+    
+class SyncState(object):
+    """Local record of what has already been pushed to Jira
+    
+    Stored as JSON, one entry per group ID holding the rule ID, the Jira
+    issue key and the fingerprint of the content that was last sent.
+    
+    Attributes:
+        path: file the state is loaded from and saved to
+        groups: dict of group ID to {"rule", "key", "fingerprint"}
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.groups = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.groups = json.load(f)
+                
+    def save(self):
+        """Write the state out, replacing the old file atomically"""
+        _tmp = self.path + '.tmp'
+        with open(_tmp, 'w') as f:
+            json.dump(self.groups, f, indent=1, sort_keys=True)
+        os.replace(_tmp, self.path)
+        
+        
+def _sync_to_jira(groups, project, user, url, state, session=None, 
+                  scheduler=None):
+    """ Bring Jira in line with groups, touching only what changed
+    
+    Groups missing from state are created, groups whose fingerprint differs
+    from the one in state are updated in place, and groups in state that 
+    are no longer in groups are transitioned to closed and forgotten.
+    
+    Args:
+        groups: iterable of StigGroup, the full current benchmark
+        project: string with jira recognized project ID
+        user: string with users jira username
+        url: string with url to Jira API required (/rest/api/2/issue)
+        state: SyncState, updated and saved as the sync runs
+        session: JiraSession to post through, defaults to a shared session
+        scheduler: JiraScheduler handling retries, defaults to a shared one
+        
+    Returns:
+        dict with lists of group IDs under "created", "updated", "closed"
+        and "unchanged", and a dict of group ID to outcome under "failed"
+    
+    Raises:
+        AssertionErrors if passed vars are not of correct type.
+    """
+    assert isinstance(state, SyncState), "Passed state is not a SyncState: %r" % state
+    if session is None:
+        session = _get_default_session()
+    if scheduler is None:
+        scheduler = _get_default_scheduler()
+    _report = {"created":[], "updated":[], "closed":[], "unchanged":[], 
+               "failed":{}}
+    _seen = set()
+    try:
+        for group in groups:
+            _seen.add(group.ID)
+            _fingerprint = fingerprint_group(group)
+            _known = state.groups.get(group.ID)
+            if _known is not None and _known["fingerprint"] == _fingerprint:
+                _report["unchanged"].append(group.ID)
+                continue
+            _fields = _group_to_fields(group, project, user)
+            if _known is None:
+                _resp = scheduler.post(session, url, 
+                                       json.dumps({"fields":_fields}), group.ID)
+                _action = "created"
+            else:
+                #project, issuetype and reporter are fixed once the issue exists
+                for _name in ("project", "issuetype", "reporter"):
+                    del _fields[_name]
+                _resp = scheduler.request(session, 'PUT', url+"/"+_known["key"],
+                                          json.dumps({"fields":_fields}), group.ID)
+                _action = "updated"
+            if not 200 <= _resp.status_code < 300:
+                _report["failed"][group.ID] = _resp.status_code
+                continue
+            if _known is None:
+                _key = _resp.json().get("key")
+            else:
+                _key = _known["key"]
+            state.groups[group.ID] = {"rule":group.rules[0].ID, "key":_key,
+                                      "fingerprint":_fingerprint}
+            _report[_action].append(group.ID)
+        for _id in sorted(set(state.groups) - _seen):
+            _data = json.dumps({"transition":{"id":JIRA_CLOSE_TRANSITION}})
+            _resp = scheduler.post(session, 
+                                   url+"/"+state.groups[_id]["key"]+"/transitions",
+                                   _data, _id)
+            if not 200 <= _resp.status_code < 300:
+                _report["failed"][_id] = _resp.status_code
+                continue
+            del state.groups[_id]
+            _report["closed"].append(_id)
+    finally:
+        state.save()
+    return _report
+    
+    
+DIFF_RULE_FIELDS = (
+    ('TITLE', lambda r: r.TITLE),
+    ('DESCRIPTION', lambda r: r.DESCRIPTION),
+    ('FIXTEXT', lambda r: r.FIXTEXT.content if r.FIXTEXT is not None else None),
+    ('checks', lambda r: [x.CONTENT for x in r.checks]),
+    ('severity', lambda r: r.severity),
+    ('weight', lambda r: r.weight),
+    )
+    
+    
+def _diff_fingerprint(rule):
+    """Hash only the rule content compared by diff_benchmarks
+    
+    Release bookkeeping such as the rule ID revision or fixref is left out
+    so a re-issued but otherwise identical rule does not show as changed.
+    """
+    _parts = []
+    for _name, _get in DIFF_RULE_FIELDS:
+        _value = _get(rule)
+        if isinstance(_value, list):
+            _parts.append(len(_value))
+            _parts.extend(_value)
+        else:
+            _parts.append(_value)
+    return _digest(_parts)
+    
+    
+def diff_benchmarks(old_groups, new_groups):
+    """Compare two releases of a benchmark
+    
+    Groups are matched by ID and the rules inside a group by VERSION. Each
+    rule is reduced to a fingerprint first, so only rules whose fingerprint
+    differs are compared field by field and the whole diff stays linear in
+    the size of the benchmarks.
+    
+    Args:
+        old_groups: iterable of StigGroup (or StigBenchmark), older release
+        new_groups: iterable of StigGroup (or StigBenchmark), newer release
+        
+    Returns:
+        dict with "added" and "removed" lists of group IDs, and "changed" 
+        mapping group ID to {rule VERSION: {field: (old, new)}}. A rule 
+        added to or removed from a matched group shows as the field "rule"
+        with (None, new rule ID) or (old rule ID, None)
+    """
+    _old = {}
+    for group in old_groups:
+        _old[group.ID] = group
+    _diff = {"added":[], "removed":[], "changed":{}}
+    _seen = set()
+    for group in new_groups:
+        _seen.add(group.ID)
+        _old_group = _old.get(group.ID)
+        if _old_group is None:
+            _diff["added"].append(group.ID)
+            continue
+        _changes = _diff_rules(_old_group.rules, group.rules)
+        if _changes:
+            _diff["changed"][group.ID] = _changes
+    _diff["removed"] = [x for x in _old if x not in _seen]
+    return _diff
+    
+    
+def _diff_rules(old_rules, new_rules):
+    """Field level changes between two lists of rules matched by VERSION"""
+    _old = dict((x.VERSION, x) for x in old_rules)
+    _changes = {}
+    for _rule in new_rules:
+        _old_rule = _old.pop(_rule.VERSION, None)
+        if _old_rule is None:
+            _changes[_rule.VERSION] = {"rule":(None, _rule.ID)}
+            continue
+        if _diff_fingerprint(_old_rule) == _diff_fingerprint(_rule):
+            continue
+        _fields = {}
+        for _name, _get in DIFF_RULE_FIELDS:
+            _before = _get(_old_rule)
+            _after = _get(_rule)
+            if _before != _after:
+                _fields[_name] = (_before, _after)
+        _changes[_rule.VERSION] = _fields
+    for _version in _old:
+        _changes[_version] = {"rule":(_old[_version].ID, None)}
+    return _changes
+    
+    
+def _text(value):
+    """Render a possibly missing model value as report text"""
+    if value is None:
+        return ''
+    return str(value)
+    
+    
+REPORT_RULE_FIELDS = (
+    ('ID', lambda r: r.ID),
+    ('DISA Severity', lambda r: r._DISA_SEVERITY),
+    ('Rule Severity', lambda r: r.severity),
+    ('DISA Weight', lambda r: r._DISA_WEIGHT),
+    ('Rule Weight', lambda r: r.weight),
+    ('Version', lambda r: r.VERSION),
+    ('Title', lambda r: r.TITLE),
+    ('Description', lambda r: r.DESCRIPTION),
+    ('Ref Title', lambda r: r.REFERENCE.title),
+    ('Ref Publisher', lambda r: r.REFERENCE.publisher),
+    ('Ref Type', lambda r: r.REFERENCE.type),
+    ('Ref Subject', lambda r: r.REFERENCE.subject),
+    ('Ref Identifier', lambda r: r.REFERENCE.identifier),
+    ('Ident', lambda r: r.IDENT.content if r.IDENT is not None else None),
+    ('Fixref', lambda r: r.FIXTEXT.fixref),
+    ('Fixtext', lambda r: r.FIXTEXT.content),
+    ('Fix ID', lambda r: r.FIX.fix_id),
+    ('Rule Checks', lambda r: len(r.checks)),
+    )
+    
+    
+class ReportTemplate(object):
+    """Base class for a report format
+    
+    A template turns one StigGroup at a time into a chunk of text, so a 
+    report is written while the groups stream in and never has to be held
+    in memory as a whole. New formats subclass this and are registered in
+    REPORT_TEMPLATES.
+    
+    Attributes:
+        extension: file extension the format is picked by
+    """
+    extension = 'txt'
+    
+    def header(self):
+        return ''
+        
+    def group(self, group):
+        raise NotImplementedError
+        
+    def footer(self):
+        return ''
+        
+        
+class HtmlReport(ReportTemplate):
+    """HTML report, one table per rule with all content escaped"""
+    extension = 'html'
+    
+    def header(self):
+        return ('<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+                '<style>td{white-space:pre-wrap}</style></head><body>\n')
+        
+    def group(self, group):
+        _parts = ['<div class="group"><h2>', html.escape(_text(group.ID)), ' ',
+                  html.escape(_text(group.TITLE)), '</h2><p>',
+                  html.escape(_text(group.DESCRIPTION)), '</p>']
+        for _rule in group.rules:
+            _parts.append('<table class="rule">')
+            for _label, _get in REPORT_RULE_FIELDS:
+                _parts.extend(['<tr><th>', _label, '</th><td>', 
+                               html.escape(_text(_get(_rule))), '</td></tr>'])
+            _parts.append('</table>')
+        _parts.append('</div>\n')
+        return ''.join(_parts)
+        
+    def footer(self):
+        return '</body></html>\n'
+        
+        
+class MarkdownReport(ReportTemplate):
+    """Markdown report, a heading per group and a field table per rule"""
+    extension = 'md'
+    _special = re.compile(r'([\\`*_\[\]|])')
+    
+    def _cell(self, value):
+        _value = self._special.sub(r'\\\1', html.escape(_text(value)))
+        return _value.replace('\r', '').replace('\n', '<br>')
+        
+    def group(self, group):
+        _parts = ['## ', self._cell(group.ID), ' ', self._cell(group.TITLE), 
+                  '\n\n', self._cell(group.DESCRIPTION), '\n\n']
+        for _rule in group.rules:
+            _parts.append('| Field | Value |\n| --- | --- |\n')
+            for _label, _get in REPORT_RULE_FIELDS:
+                _parts.extend(['| ', _label, ' | ', self._cell(_get(_rule)), ' |\n'])
+            _parts.append('\n')
+        return ''.join(_parts)
+        
+        
+class CsvReport(ReportTemplate):
+    """CSV report, one row per rule carrying its group's columns"""
+    extension = 'csv'
+    
+    def _row(self, values):
+        _buf = io.StringIO()
+        csv.writer(_buf, lineterminator='\n').writerow(values)
+        return _buf.getvalue()
+        
+    def header(self):
+        return self._row(['Group ID', 'Group Title', 'Group Description'] + 
+                         [x[0] for x in REPORT_RULE_FIELDS])
+                         
+    def group(self, group):
+        _group = [_text(group.ID), _text(group.TITLE), _text(group.DESCRIPTION)]
+        return ''.join(self._row(_group + [_text(_get(_rule)) for _label, _get 
+                                           in REPORT_RULE_FIELDS])
+                       for _rule in group.rules)
+                       
+                       
+REPORT_TEMPLATES = {'html': HtmlReport, 'md': MarkdownReport, 'csv': CsvReport}
+
+
+def write_report(groups, output, fmt='html', buffer_size=REPORT_BUFFER_SIZE):
+    """Stream groups into a report file
+    
+    Args:
+        groups: iterable of StigGroup, e.g. straight from iter_groups
+        output: path to write, or an already open text file
+        fmt: key of REPORT_TEMPLATES or a ReportTemplate instance
+        buffer_size: write buffer size in bytes when output is a path
+        
+    Returns:
+        number of groups written
+    
+    Raises:
+        KeyError if fmt is not a known report format
+    """
+    if isinstance(fmt, ReportTemplate):
+        _template = fmt
+    else:
+        _template = REPORT_TEMPLATES[fmt]()
+    if isinstance(output, str):
+        with open(output, 'w', encoding='utf-8', newline='', 
+                  buffering=buffer_size) as f:
+            return write_report(groups, f, _template)
+    _count = 0
+    output.write(_template.header())
+    for group in groups:
+        output.write(_template.group(group))
+        _count += 1
+    output.write(_template.footer())
+    return _count
+    
+    
+def printToHTML(groups, path=None):
+    """
+    Args:
+        groups: Master list of all Requirements
+        path: file to write, defaults to ./results.<time>.html
+        
+    Returns:
+        True is succeeded, False in not
+    
+    Raises:
+        N/A
+    """
+    if path is None:
+        path = './results.'+str(time.time())+'.html'
+    write_report(groups, path, 'html')
+    return True    
+    
+    
+def _float(value):
+    """Convert a weight to float, None if it is missing or not a number"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+        
+        
+#Columns of each normalized table as (name, type, getter). The getters take
+#(benchmark, group, rule, index, item) where item is the row's own object,
+#i.e. the group, rule, check or reference
+TABLE_COLUMNS = {
+    'groups': (
+        ('benchmark', 'str', lambda b, g, r, i, x: b),
+        ('group_id', 'str', lambda b, g, r, i, x: g.ID),
+        ('title', 'str', lambda b, g, r, i, x: g.TITLE),
+        ('description', 'str', lambda b, g, r, i, x: g.DESCRIPTION),
+        ('rule_count', 'int', lambda b, g, r, i, x: len(g.rules)),
+        ),
+    'rules': (
+        ('benchmark', 'str', lambda b, g, r, i, x: b),
+        ('rule_id', 'str', lambda b, g, r, i, x: r.ID),
+        ('group_id', 'str', lambda b, g, r, i, x: g.ID),
+        ('version', 'str', lambda b, g, r, i, x: r.VERSION),
+        ('title', 'str', lambda b, g, r, i, x: r.TITLE),
+        ('description', 'str', lambda b, g, r, i, x: r.DESCRIPTION),
+        ('disa_severity', 'str', lambda b, g, r, i, x: r._DISA_SEVERITY),
+        ('severity', 'str', lambda b, g, r, i, x: r.severity),
+        ('disa_weight', 'float', lambda b, g, r, i, x: _float(r._DISA_WEIGHT)),
+        ('weight', 'float', lambda b, g, r, i, x: _float(r.weight)),
+        ('ident_system', 'str', 
+         lambda b, g, r, i, x: r.IDENT.system if r.IDENT is not None else None),
+        ('ident', 'str', 
+         lambda b, g, r, i, x: r.IDENT.content if r.IDENT is not None else None),
+        ('fixref', 'str', lambda b, g, r, i, x: r.FIXTEXT.fixref),
+        ('fixtext', 'str', lambda b, g, r, i, x: r.FIXTEXT.content),
+        ('fix_id', 'str', lambda b, g, r, i, x: r.FIX.fix_id),
+        ),
+    'checks': (
+        ('benchmark', 'str', lambda b, g, r, i, x: b),
+        ('rule_id', 'str', lambda b, g, r, i, x: r.ID),
+        ('check_index', 'int', lambda b, g, r, i, x: i),
+        ('system', 'str', lambda b, g, r, i, x: x.SYSTEM),
+        ('name', 'str', lambda b, g, r, i, x: x.NAME),
+        ('href', 'str', lambda b, g, r, i, x: x.HREF),
+        ('content', 'str', lambda b, g, r, i, x: x.CONTENT),
+        ),
+    'references': (
+        ('benchmark', 'str', lambda b, g, r, i, x: b),
+        ('rule_id', 'str', lambda b, g, r, i, x: r.ID),
+        ('title', 'str', lambda b, g, r, i, x: x.title),
+        ('publisher', 'str', lambda b, g, r, i, x: x.publisher),
+        ('type', 'str', lambda b, g, r, i, x: x.type),
+        ('subject', 'str', lambda b, g, r, i, x: x.subject),
+        ('identifier', 'str', lambda b, g, r, i, x: x.identifier),
+        ),
+    }
+TABLE_BATCH_SIZE = 1000
+_TABLE_TYPES = {'str': str, 'int': int, 'float': float}
+
+
+def iter_table_rows(groups, benchmark=None):
+    """ Flatten groups into rows of the normalized tables
+    Args:
+        groups: iterable of StigGroup, consumed lazily
+        benchmark: benchmark id stored in every row, lets tables of several
+                   benchmarks share a store
+        
+    Yields:
+        (table name, row tuple) in TABLE_COLUMNS order. Missing values are None
+    """
+    _groups = TABLE_COLUMNS['groups']
+    _rules = TABLE_COLUMNS['rules']
+    _checks = TABLE_COLUMNS['checks']
+    _references = TABLE_COLUMNS['references']
+    for group in groups:
+        yield 'groups', tuple(x[2](benchmark, group, None, None, group) for x in _groups)
+        for _rule in group.rules:
+            yield 'rules', tuple(x[2](benchmark, group, _rule, None, _rule) 
+                                 for x in _rules)
+            for i, _check in enumerate(_rule.checks):
+                yield 'checks', tuple(x[2](benchmark, group, _rule, i, _check) 
+                                      for x in _checks)
+            yield 'references', tuple(x[2](benchmark, group, _rule, None, 
+                                           _rule.REFERENCE) for x in _references)
+                                           
+                                           
+def write_tables(groups, directory, benchmark=None, append=False,
+                 batch_size=TABLE_BATCH_SIZE, buffer_size=REPORT_BUFFER_SIZE):
+    """ Export groups as normalized CSV tables for pandas or SQL loaders
+    
+    Writes groups.csv, rules.csv, checks.csv and references.csv plus a
+    schema.json giving the type of every column. Rows are gathered per table
+    and written batch_size at a time. Missing values are written as empty 
+    fields, read_tables turns them back into None.
+    
+    Args:
+        groups: iterable of StigGroup, consumed lazily
+        directory: directory the tables are written to, created if missing
+        benchmark: benchmark id stored in every row
+        append: add rows to existing tables instead of replacing them, for
+                loading several benchmarks into one set of tables
+        batch_size: rows buffered per table before they are written
+        buffer_size: write buffer of each table file in bytes
+        
+    Returns:
+        dict of table name to number of rows written
+    """
+    os.makedirs(directory, exist_ok=True)
+    _files = {}
+    _writers = {}
+    _pending = {}
+    _counts = {}
+    try:
+        for _table in TABLE_COLUMNS:
+            _path = os.path.join(directory, _table + '.csv')
+            _header = not (append and os.path.exists(_path))
+            _files[_table] = open(_path, 'a' if append else 'w', encoding='utf-8',
+                                  newline='', buffering=buffer_size)
+            _writers[_table] = csv.writer(_files[_table], lineterminator='\n')
+            if _header:
+                _writers[_table].writerow([x[0] for x in TABLE_COLUMNS[_table]])
+            _pending[_table] = []
+            _counts[_table] = 0
+        for _table, _row in iter_table_rows(groups, benchmark):
+            _batch = _pending[_table]
+            _batch.append(_row)
+            if len(_batch) >= batch_size:
+                _writers[_table].writerows(_batch)
+                _counts[_table] += len(_batch)
+                _pending[_table] = []
+        for _table in _pending:
+            _writers[_table].writerows(_pending[_table])
+            _counts[_table] += len(_pending[_table])
+    finally:
+        for f in _files.values():
+            f.close()
+    with open(os.path.join(directory, 'schema.json'), 'w') as f:
+        json.dump(dict((_table, [[x[0], x[1]] for x in TABLE_COLUMNS[_table]]) 
+                       for _table in TABLE_COLUMNS), f, indent=1)
+    return _counts
+    
+    
+def read_tables(directory):
+    """ Load tables written by write_tables back with their column types
+    Args:
+        directory: directory holding the tables and schema.json
+        
+    Returns:
+        dict of table name to dict of column name to list of values
+    """
+    with open(os.path.join(directory, 'schema.json')) as f:
+        _schema = json.load(f)
+    _tables = {}
+    for _table in _schema:
+        _names = [x[0] for x in _schema[_table]]
+        _types = [_TABLE_TYPES[x[1]] for x in _schema[_table]]
+        _columns = [[] for x in _names]
+        with open(os.path.join(directory, _table + '.csv'), encoding='utf-8', 
+                  newline='') as f:
+            _reader = csv.reader(f)
+            next(_reader, None)
+            for _row in _reader:
+                for i, _value in enumerate(_row):
+                    _columns[i].append(_types[i](_value) if _value != '' else None)
+        _tables[_table] = dict(zip(_names, _columns))
+    return _tables
+    
+    
+FANOUT_QUEUE_SIZE = 256     #groups buffered per sink before the parser waits
+_SQLITE_TYPES = {'str': 'TEXT', 'int': 'INTEGER', 'float': 'REAL'}
+
+
+class Sink(object):
+    """Base class for a destination groups are fanned out to
+    
+    fan_out runs every sink's consume() in its own thread and feeds it the 
+    groups of a single parse as they are produced. New destinations subclass
+    this.
+    
+    Attributes:
+        name: label the sink is reported under
+    """
+    name = 'sink'
+    
+    def consume(self, groups):
+        """Handle every group of the run
+    
+        Args:
+            groups: iterable of StigGroup, ends when the parse is done
+        
+        Returns:
+            summary of what was done, reported back by fan_out
+        """
+        raise NotImplementedError
+        
+        
+class JiraSink(Sink):
+    """Create an issue per group in one Jira project
+    
+    Attributes:
+        project: string with jira recognized project ID
+        user: string with users jira username
+        url: string with url to Jira API (/rest/api/2/issue)
+        concurrency: issue creations kept in flight
+        bulk: create through the bulk endpoint, this many per request, if > 0
+        reconcile: skip groups that already have an issue, see iter_missing
+        scheduler: JiraScheduler, share one between sinks on the same server
+    """
+    
+    def __init__(self, project, user, url, concurrency=1, bulk=0, reconcile=False,
+                 scheduler=None):
+        self.name = 'jira:%s' % project
+        self.project = project
+        self.user = user
+        self.url = url
+        self.concurrency = concurrency
+        self.bulk = bulk
+        self.reconcile = reconcile
+        self.scheduler = scheduler if scheduler is not None else JiraScheduler()
+        
+    def consume(self, groups):
+        """Returns a dict with created and skipped counts and failed group IDs"""
+        _existing = {}
+        _failed = {}
+        with JiraSession(pool_size=max(JIRA_POOL_SIZE, self.concurrency)) as _session:
+            if self.reconcile:
+                groups = iter_missing(groups, self.project, 
+                                      self.url.rsplit('/issue', 1)[0] + '/search',
+                                      _session, self.scheduler, _existing)
+            if self.bulk > 0:
+                _created, _failed = _bulk_to_jira(groups, self.project, self.user,
+                                                  self.url + "/bulk", self.bulk,
+                                                  _session, self.scheduler)
+                _count = len(_created)
+            else:
+                _results = _async_to_jira(groups, self.project, self.user, self.url,
+                                          self.concurrency, _session, self.scheduler)
+                _count = 0
+                for _id in _results:
+                    if _results[_id] is True:
+                        _count += 1
+                    else:
+                        _failed[_id] = self.scheduler.outcomes.get(_id, _results[_id])
+        return {"created": _count, "skipped": len(_existing), "failed": _failed}
+        
+        
+class NdjsonSink(Sink):
+    """Write the Jira payload of every group to a file, see write_payloads
+    
+    The file is written under a temporary name and only moved into place 
+    once every group has been written, so an aborted run leaves any earlier
+    file untouched.
+    """
+    
+    def __init__(self, path, project, user):
+        self.name = 'ndjson:%s' % path
+        self.path = path
+        self.project = project
+        self.user = user
+        
+    def consume(self, groups):
+        if self.path == '-':
+            return {"written": write_payloads(groups, '-', self.project, self.user)}
+        _tmp = self.path + '.tmp'
+        try:
+            _count = write_payloads(groups, _tmp, self.project, self.user)
+        except BaseException:
+            if os.path.exists(_tmp):
+                os.remove(_tmp)
+            raise
+        os.replace(_tmp, self.path)
+        return {"written": _count}
+        
+        
+class SqliteSink(Sink):
+    """Archive groups into a SQLite database as the write_tables tables
+    
+    Rows already stored for the same benchmark are replaced, so archiving a
+    benchmark twice does not duplicate it.
+    """
+    
+    def __init__(self, path, benchmark=None, batch_size=TABLE_BATCH_SIZE):
+        self.name = 'sqlite:%s' % path
+        self.path = path
+        self.benchmark = benchmark
+        self.batch_size = batch_size
+        
+    def consume(self, groups):
+        """Returns a dict of table name to number of rows written"""
+        #sqlite3 connections belong to the thread that opened them
+        _db = sqlite3.connect(self.path)
+        try:
+            _inserts = {}
+            for _table in TABLE_COLUMNS:
+                _columns = TABLE_COLUMNS[_table]
+                _db.execute('CREATE TABLE IF NOT EXISTS "%s" (%s)' % (_table, ', '.join(
+                    '"%s" %s' % (x[0], _SQLITE_TYPES[x[1]]) for x in _columns)))
+                _db.execute('DELETE FROM "%s" WHERE benchmark IS ?' % _table, 
+                            (self.benchmark,))
+                _inserts[_table] = 'INSERT INTO "%s" VALUES (%s)' % (
+                    _table, ', '.join('?' for x in _columns))
+            _pending = dict((x, []) for x in TABLE_COLUMNS)
+            _counts = dict((x, 0) for x in TABLE_COLUMNS)
+            for _table, _row in iter_table_rows(groups, self.benchmark):
+                _pending[_table].append(_row)
+                if len(_pending[_table]) >= self.batch_size:
+                    _db.executemany(_inserts[_table], _pending[_table])
+                    _counts[_table] += len(_pending[_table])
+                    _pending[_table] = []
+            for _table in _pending:
+                _db.executemany(_inserts[_table], _pending[_table])
+                _counts[_table] += len(_pending[_table])
+            _db.commit()
+        except BaseException:
+            #Keep what was archived before, not a partial benchmark
+            _db.rollback()
+            raise
+        finally:
+            _db.close()
+        return _counts
+        
+        
+def fan_out(groups, sinks, queue_size=FANOUT_QUEUE_SIZE):
+    """ Feed the groups of one parse to several sinks at once
+    
+    Every sink consumes from its own bounded queue in its own thread, so the
+    parse runs once and the slowest sink only holds back the parser once its
+    queue is full. A sink that fails stops receiving groups without 
+    affecting the others. If the groups iterator raises, every sink sees an
+    Exception from its groups instead of a normal end, so it can roll back
+    rather than keep a partial result, and the error is raised again here.
+    
+    Args:
+        groups: iterable of StigGroup, consumed once
+        sinks: list of Sink
+        queue_size: groups buffered per sink
+        
+    Returns:
+        list with, for every sink in order, what its consume() returned or 
+        the exception it raised
+    """
+    _done = object()
+    _aborted = object()
+    _queues = [queue.Queue(queue_size) for x in sinks]
+    _results = [None] * len(sinks)
+    
+    def _drain(q):
+        while True:
+            _group = q.get()
+            if _group is _done:
+                return
+            if _group is _aborted:
+                raise Exception('Parse failed, groups are incomplete')
+            yield _group
+            
+    def _run(i):
+        _groups = _drain(_queues[i])
+        try:
+            _results[i] = sinks[i].consume(_groups)
+        except Exception as e:
+            logging.error('Sink %s failed: %s', sinks[i].name, e)
+            _results[i] = e
+        #Keep taking groups off the queue so the parser never blocks on us
+        try:
+            for _group in _groups:
+                pass
+        except Exception:
+            pass
+            
+    _threads = [threading.Thread(target=_run, args=(i,), name=sinks[i].name)
+                for i in range(len(sinks))]
+    for _thread in _threads:
+        _thread.start()
+    _end = _aborted
+    try:
+        for group in groups:
+            for q in _queues:
+                q.put(group)
+        _end = _done
+    finally:
+        for q in _queues:
+            q.put(_end)
+        for _thread in _threads:
+            _thread.join()
+    return _results
+    
+    
+SEARCH_INDEX_VERSION = 2
+SEARCH_TOKEN = re.compile(r'[a-z0-9_]+')
+SEARCH_QUERY = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def _search_fields(rule):
+    """The texts of a rule that go into the search index"""
+    _texts = [rule.DESCRIPTION, rule.FIXTEXT.content]
+    _texts.extend(x.CONTENT for x in rule.checks)
+    return [x for x in _texts if x]
+    
+    
+class SearchIndex(object):
+    """Positional inverted index over rule descriptions, fix texts and checks
+    
+    Text is lower cased and split on anything that is not a letter, digit or
+    underscore, so a registry path such as \\System\\CurrentControlSet\\Control\\Lsa
+    is indexed as the phrase system currentcontrolset control lsa. Every 
+    term maps to the rules it appears in and the positions it appears at,
+    which is enough to answer keyword and phrase queries without touching 
+    the XML. Matches are ranked with BM25. Benchmarks are added and replaced
+    one at a time, and the index is pickled to disk between runs.
+    
+    Attributes:
+        path: file the index is loaded from and saved to, None keeps it in
+              memory only
+        benchmarks: dict of benchmark id to the digest it was indexed with
+    """
+    k1 = 1.2
+    b = 0.75
+    
+    def __init__(self, path=None):
+        self.path = path
+        self.benchmarks = {}
+        self._docs = []         #doc number -> (benchmark, group ID, rule ID), None once removed
+        self._lengths = []      #doc number -> number of terms
+        self._postings = {}     #term -> {doc number: [positions]}
+        self._terms = {}        #benchmark -> set of terms its rules use
+        self._live = 0
+        self._total_length = 0
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                _data = pickle.load(f)
+            if _data.get('version') == SEARCH_INDEX_VERSION:
+                self.benchmarks = _data['benchmarks']
+                self._docs = _data['docs']
+                self._lengths = _data['lengths']
+                self._postings = _data['postings']
+                self._terms = _data['terms']
+                self._live = _data['live']
+                self._total_length = _data['total_length']
+                
+    def save(self):
+        """Compact and write the index out, replacing the old file atomically"""
+        self.compact()
+        _tmp = self.path + '.tmp'
+        with open(_tmp, 'wb') as f:
+            pickle.dump({'version': SEARCH_INDEX_VERSION, 
+                         'benchmarks': self.benchmarks, 'docs': self._docs,
+                         'lengths': self._lengths, 'postings': self._postings,
+                         'terms': self._terms, 'live': self._live, 
+                         'total_length': self._total_length},
+                        f, pickle.HIGHEST_PROTOCOL)
+        os.replace(_tmp, self.path)
+        
+    def add_benchmark(self, groups, benchmark, digest=None):
+        """Index every rule of a benchmark, replacing what it held before
+    
+        Only the postings of this benchmark are touched, other benchmarks 
+        already in the index are left as they are.
+    
+        Args:
+            groups: iterable of StigGroup
+            benchmark: benchmark id the rules are filed under
+            digest: content digest of the source, see is_current()
+        
+        Returns:
+            number of rules indexed
+        """
+        if benchmark in self.benchmarks:
+            self.remove_benchmark(benchmark)
+        _count = 0
+        _terms = set()
+        for group in groups:
+            for _rule in group.rules:
+                _terms.update(self._add_doc((benchmark, group.ID, _rule.ID), 
+                                            _search_fields(_rule)))
+                _count += 1
+        self.benchmarks[benchmark] = digest
+        self._terms[benchmark] = _terms
+        return _count
+        
+    def _add_doc(self, doc, texts):
+        """Index one rule, returns the terms it holds"""
+        _number = len(self._docs)
+        _terms = set()
+        self._docs.append(doc)
+        _position = 0
+        for _text in texts:
+            for _term in SEARCH_TOKEN.findall(_text.lower()):
+                _terms.add(_term)
+                self._postings.setdefault(_term, {}).setdefault(_number, []).append(_position)
+                _position += 1
+            #Leave a gap so a phrase never matches across two fields
+            _position += 1
+        self._lengths.append(_position)
+        self._live += 1
+        self._total_length += _position
+        return _terms
+        
+    def remove_benchmark(self, benchmark):
+        """Drop every rule of a benchmark from the index"""
+        _removed = set()
+        for _number, _doc in enumerate(self._docs):
+            if _doc is not None and _doc[0] == benchmark:
+                _removed.add(_number)
+                self._docs[_number] = None
+                self._live -= 1
+                self._total_length -= self._lengths[_number]
+        for _term in self._terms.pop(benchmark, ()):
+            _posting = self._postings.get(_term)
+            if _posting is None:
+                continue
+            for _number in _removed.intersection(_posting):
+                del _posting[_number]
+            if not _posting:
+                del self._postings[_term]
+        self.benchmarks.pop(benchmark, None)
+        return True
+        
+    def compact(self):
+        """Renumber the documents to drop the slots of removed rules"""
+        if self._live == len(self._docs):
+            return True
+        _numbers = {}
+        _docs = []
+        _lengths = []
+        for _number, _doc in enumerate(self._docs):
+            if _doc is not None:
+                _numbers[_number] = len(_docs)
+                _docs.append(_doc)
+                _lengths.append(self._lengths[_number])
+        for _term in self._postings:
+            self._postings[_term] = dict((_numbers[k], v) for k, v 
+                                         in self._postings[_term].items())
+        self._docs = _docs
+        self._lengths = _lengths
+        return True
+        
+    def is_current(self, benchmark, digest):
+        """True if the benchmark is indexed from a source with this digest"""
+        return benchmark in self.benchmarks and self.benchmarks[benchmark] == digest
+        
+    def search(self, query, limit=10):
+        """Return the rules matching every keyword and phrase of the query
+    
+        Args:
+            query: keywords and "quoted phrases". A word that splits into 
+                   several terms, like a registry path, counts as a phrase
+            limit: max number of results, None for all of them
+        
+        Returns:
+            list of (score, benchmark, group ID, rule ID), best match first
+        """
+        _phrases = []
+        for _quoted, _word in SEARCH_QUERY.findall(query):
+            _terms = SEARCH_TOKEN.findall((_quoted or _word).lower())
+            if _terms:
+                _phrases.append(_terms)
+        if not _phrases:
+            return []
+        _terms = set(x for _phrase in _phrases for x in _phrase)
+        _postings = [self._postings.get(x) for x in _terms]
+        if not all(_postings):
+            return []
+        #Intersect starting from the rarest term
+        _postings.sort(key=len)
+        _matches = set(_postings[0])
+        for _posting in _postings[1:]:
+            _matches.intersection_update(_posting)
+            if not _matches:
+                return []
+        for _phrase in _phrases:
+            if len(_phrase) > 1:
+                _matches = set(x for x in _matches if self._has_phrase(x, _phrase))
+        _results = []
+        for _number in _matches:
+            _doc = self._docs[_number]
+            _results.append((round(self._score(_number, _terms), 6),) + _doc)
+        _results.sort(key=lambda x: (-x[0], x[1:]))
+        if limit is not None:
+            _results = _results[:limit]
+        return _results
+        
+    def _has_phrase(self, number, phrase):
+        _starts = set(self._postings[phrase[0]][number])
+        for i, _term in enumerate(phrase[1:], 1):
+            _starts.intersection_update(x - i for x in self._postings[_term][number])
+            if not _starts:
+                return False
+        return True
+        
+    def _score(self, number, terms):
+        _average = self._total_length / float(self._live)
+        _norm = self.k1 * (1 - self.b + self.b * self._lengths[number] / _average)
+        _score = 0.0
+        for _term in terms:
+            _posting = self._postings[_term]
+            _tf = len(_posting[number])
+            _idf = math.log(1 + (self._live - len(_posting) + 0.5) / (len(_posting) + 0.5))
+            _score += _idf * _tf * (self.k1 + 1) / (_tf + _norm)
+        return _score
+        
+    def __len__(self):
+        return self._live
+        
+        
+def main(argv=None):
+    """
+    Args:
+        argv: list of command line arguments, defaults to sys.argv[1:]
+    Returns:
+        True or False
+    Raises:
+    """
+    _parser = argparse.ArgumentParser(description='Import a DISA STIG into Jira')
+    _parser.add_argument('xml_files', nargs='*', metavar='xml_file',
+                         default=[XML_FILE],
+                         help='XCCDF documents to import, or directories of '
+                              'them. Several are parsed in parallel and '
+                              'handled as one list of groups')
+    _parser.add_argument('--processes', type=int, metavar='N',
+                         help='parse several xml_files in up to N worker '
+                              'processes, defaults to the CPU count')
+    _parser.add_argument('--bulk', type=int, metavar='N', default=0,
+                         help='create issues through the bulk endpoint, N per request')
+    _parser.add_argument('--concurrency', type=int, metavar='N', default=1,
+                         help='keep up to N issue creations in flight at once')
+    _parser.add_argument('--sync', metavar='STATE_FILE',
+                         help='only create, update or close issues that changed '
+                              'since the state recorded in STATE_FILE')
+    _parser.add_argument('--retries', type=int, metavar='N', default=JIRA_MAX_RETRIES,
+                         help='retry throttled or failed requests up to N times')
+    _parser.add_argument('--journal', metavar='FILE',
+                         help='append the outcome of every group to FILE')
+    _parser.add_argument('--resume', action='store_true',
+                         help='skip groups the journal records as already created')
+    _parser.add_argument('--profile', metavar='ID',
+                         help='only import groups selected by this XCCDF Profile, '
+                              'e.g. MAC-1_Classified')
+    _parser.add_argument('--report', metavar='FILE',
+                         help='write an html, md or csv report (picked by the '
+                              'extension of FILE) instead of exporting to Jira')
+    _parser.add_argument('--diff', metavar='OLD_XML',
+                         help='print the changes from OLD_XML to xml_file as JSON '
+                              'instead of exporting to Jira')
+    _parser.add_argument('--metrics', metavar='FILE',
+                         help='dump run metrics to FILE, as JSON if it ends in '
+                              '.json and as a Prometheus textfile otherwise')
+    _parser.add_argument('--cache', metavar='DIR', nargs='?', const=CACHE_DIR,
+                         help='load the parsed benchmark through the cache in DIR')
+    _parser.add_argument('--dry-run', metavar='FILE',
+                         help='write the Jira issue payloads to FILE (- for '
+                              'stdout), one JSON document per line, instead '
+                              'of exporting to Jira')
+    _parser.add_argument('--upload', metavar='FILE',
+                         help='create issues from a --dry-run FILE (- for '
+                              'stdin) instead of parsing xml_file')
+    _parser.add_argument('--tables', metavar='DIR',
+                         help='write groups, rules, checks and references as '
+                              'CSV tables to DIR instead of exporting to Jira')
+    _parser.add_argument('--append', action='store_true',
+                         help='with --tables, add to the tables already in DIR')
+    _parser.add_argument('--project', default=JIRA_PROJECT,
+                         help='Jira project ID issues are created in')
+    _parser.add_argument('--user', default=JIRA_USER,
+                         help='Jira user set as the reporter')
+    _parser.add_argument('--url', default=JIRA_URL,
+                         help='Jira issue API, e.g. https://jira/rest/api/2/issue')
+    _parser.add_argument('--sink', metavar='SPEC', action='append', default=[],
+                         help='parse once and send the groups to every sink '
+                              'at the same time. SPEC is jira:PROJECT[@URL], '
+                              'ndjson:FILE or sqlite:FILE. Repeatable')
+    _parser.add_argument('--reconcile', action='store_true',
+                         help='search Jira for issues already labelled with a '
+                              'group ID and only create the missing ones')
+    _parser.add_argument('--no-stream', dest='stream', action='store_false',
+                         help='load each XML document whole instead of '
+                              'streaming it, faster but its memory grows '
+                              'with the file size')
+    _parser.add_argument('--lazy', action='store_true',
+                         help='only decode group and rule headers up front, '
+                              'the rest of a group when it is first needed')
+    _parser.add_argument('--list', action='store_true',
+                         help='print the ID, rule, severity, weight and title '
+                              'of every group and exit, implies --lazy')
+    _parser.add_argument('--group', metavar='ID',
+                         help='print one group (e.g. V-1070) as markdown, read '
+                              'through the <xml_file>.idx side-car index')
+    _parser.add_argument('--index', metavar='FILE',
+                         help='add each xml_file to the search index in FILE, '
+                              'skipping those already indexed unchanged')
+    _parser.add_argument('--search', metavar='QUERY',
+                         help='print the rules in the --index matching QUERY, '
+                              'keywords and "quoted phrases"')
+    _parser.add_argument('--limit', type=int, metavar='N', default=20,
+                         help='max number of --search results')
+    _parser.add_argument('--priority-policy', metavar='FILE',
+                         help='JSON file with "severities" ranks and score '
+                              '"thresholds" used to pick issue priorities')
+    _args = _parser.parse_args(argv)
+    _args.xml_files = list_xml_files(_args.xml_files)
+    if not _args.xml_files:
+        _parser.error('no XCCDF files found')
+    #Modes that work on one benchmark read the first (and only) xml_file
+    _args.xml_file = _args.xml_files[0]
+    if len(_args.xml_files) > 1:
+        for _option in ('group', 'diff', 'sink'):
+            if getattr(_args, _option):
+                _parser.error('--%s takes a single xml_file' % _option)
+    if _args.resume and not _args.journal:
+        _parser.error('--resume needs --journal')
+    if _args.sync and _args.journal:
+        #The sync state already says what was sent, and a resumed (filtered) 
+        #group list would make every journaled group look removed
+        _parser.error('--journal and --resume can not be used with --sync')
+    if _args.priority_policy:
+        _policy = PriorityPolicy.load(_args.priority_policy)
+        priority_policy.configure(_policy.severities, _policy.thresholds)
+    try:
+        return _run(_args, _parser)
+    finally:
+        #A run that raised is the one whose metrics are needed most
+        _finish(_args)
+    
+    
+def _run(args, parser):
+    """ main() after the arguments are parsed, runs the selected mode
+    
+    Returns:
+        True or False
+    """
+    _project = args.project
+    _user = args.user
+    _url = args.url
+    if args.upload:
+        return _upload(args, _url)
+    if args.search and not args.index:
+        parser.error('--search needs --index')
+    if args.index:
+        return _search(args)
+    if args.group:
+        with GroupIndex(args.xml_file) as _index:
+            _group = _index.get(args.group)
+        if _group is None:
+            logging.error('No group %s in %s', args.group, args.xml_file)
+            return False
+        write_report([_group], sys.stdout, 'md')
+        return True
+    _groups = (x for _, _file_groups in _benchmark_groups(args) 
+               for x in _file_groups)
+    if args.list:
+        for group in _groups:
+            for _rule in group.rules:
+                print('\t'.join([group.ID, _rule.ID, _rule.severity, 
+                                 _rule.weight, _text(group.TITLE)]))
+        return True
+    if args.diff:
+        if args.cache:
+            _old = load_groups(args.diff, args.cache, profile=args.profile)
+        else:
+            _old = read_groups(args.diff, args.profile, args.stream)
+        json.dump(diff_benchmarks(_old, _groups), sys.stdout, indent=1, 
+                  sort_keys=True)
+        print()
+        return True
+    if args.report:
+        _fmt = os.path.splitext(args.report)[1].lstrip('.').lower()
+        if _fmt not in REPORT_TEMPLATES:
+            _fmt = 'html'
+        _count = write_report(_groups, args.report, _fmt)
+        logging.info('Wrote %s groups to %s', _count, args.report)
+        return True
+    if args.tables:
+        #One pass per benchmark so every row carries its own benchmark id
+        _append = args.append
+        for _file, _file_groups in _benchmark_groups(args):
+            _counts = write_tables(_file_groups, args.tables, 
+                                   benchmark_id(_file), _append)
+            for _table in _counts:
+                logging.info('Wrote %s rows to %s', _counts[_table], _table)
+            _append = True
+        return True
+    if args.sink:
+        try:
+            _sinks = _make_sinks(args, benchmark_id(args.xml_file))
+        except ValueError as e:
+            parser.error(str(e))
+        _results = fan_out(_groups, _sinks)
+        for _sink, _result in zip(_sinks, _results):
+            if isinstance(_result, Exception):
+                logging.error('%s failed: %s', _sink.name, _result)
+            else:
+                logging.info('%s: %s', _sink.name, _result)
+        return not any(isinstance(x, Exception) for x in _results)
+    if args.dry_run:
+        _count = write_payloads(_groups, args.dry_run, _project, _user)
+        logging.info('Wrote %s payloads to %s', _count, args.dry_run)
+        return True
+    _scheduler = JiraScheduler(max_retries=args.retries)
+    _journal = None
+    if args.journal:
+        _journal = ExportJournal(args.journal)
+        if args.resume:
+            _groups = _journal.pending(_groups)
+    with JiraSession(pool_size=max(JIRA_POOL_SIZE, args.concurrency)) as _session:
+        _existing = {}
+        if args.reconcile and not args.sync:
+            _groups = iter_missing(_groups, _project, 
+                                   _url.rsplit('/issue', 1)[0] + '/search',
+                                   _session, _scheduler, _existing)
+        if args.sync:
+            _report = _sync_to_jira(_groups, _project, _user,
+                                    _url, SyncState(args.sync), _session,
+                                    _scheduler)
+            for _action in ("created", "updated", "closed", "unchanged"):
+                logging.info('%s: %s', _action, len(_report[_action]))
+            for _id in _report["failed"]:
+                logging.error('Failed to sync %s: %s', _id, _report["failed"][_id])
+            _ok = len(_report["failed"]) == 0
+        elif args.bulk > 0:
+            _created, _failed = _bulk_to_jira(_groups, _project, _user, 
+                                              _url+"/bulk", args.bulk, 
+                                              _session, _scheduler, _journal)
+            for _id in _failed:
+                logging.error('Failed to create %s: %s', _id, _failed[_id])
+            _ok = len(_failed) == 0
+        elif args.concurrency > 1:
+            _results = _async_to_jira(_groups, _project, _user, _url, 
+                                      args.concurrency, _session, _scheduler,
+                                      _journal)
+            for _id in _results:
+                if _results[_id] is not True:
+                    logging.error('Failed to create %s: %s', _id, 
+                                  _scheduler.outcomes.get(_id, _results[_id]))
+            _ok = all(x is True for x in _results.values())
+        else:
+            _ok = True
+            for group in _groups:
+                try:
+                    _created = _json_to_jira(group, _project, _user, _url, 
+                                             _session, _scheduler, _journal)
+                except requests.RequestException:
+                    _created = False
+                if not _created:
+                    logging.error('Failed to create %s: %s', group.ID,
+                                  _scheduler.outcomes.get(group.ID))
+                    _ok = False
+    if _journal is not None:
+        _journal.close()
+    if args.reconcile:
+        logging.info('Already in Jira, skipped: %s', len(_existing))
+    logging.info('Jira requests retried: %s', _scheduler.retries)
+    return _ok
+    
+    
+def _upload(args, url):
+    """ main() side of --upload, replays a dry run file into Jira"""
+    _scheduler = JiraScheduler(max_retries=args.retries)
+    _payloads = read_payloads(args.upload)
+    _journal = None
+    if args.journal:
+        _journal = ExportJournal(args.journal)
+        if args.resume:
+            _payloads = ((_key, _data) for _key, _data in _payloads 
+                         if _key not in _journal.completed)
+    try:
+        _results = upload_payloads(_payloads, url, args.concurrency, None,
+                                   _scheduler, _journal)
+    finally:
+        if _journal is not None:
+            _journal.close()
+    for _id in _results:
+        if _results[_id] is not True:
+            logging.error('Failed to create %s: %s', _id, 
+                          _scheduler.outcomes.get(_id, _results[_id]))
+    logging.info('Jira requests retried: %s', _scheduler.retries)
+    return all(x is True for x in _results.values())
+    
+    
+def _benchmark_groups(args):
+    """ Yield (xml_file, groups) for every xml_file given to main(), in order
+    
+    A single file is read through the cache, lazily or by read_groups as 
+    selected. Several files are parsed in parallel by parse_benchmarks, 
+    unless they are read through the cache or lazily, which is per file.
+    """
+    if len(args.xml_files) > 1 and not (args.cache or args.lazy or args.list):
+        _parsed = parse_benchmarks(args.xml_files, args.processes, 
+                                   args.profile)
+        for _file in args.xml_files:
+            yield _file, _parsed[_file]
+        return
+    for _file in args.xml_files:
+        if args.cache:
+            yield _file, load_groups(_file, args.cache, profile=args.profile)
+        elif args.lazy or args.list:
+            yield _file, iter_lazy_groups(_file, args.profile)
+        else:
+            yield _file, read_groups(_file, args.profile, args.stream)
+    
+    
+def _search(args):
+    """ main() side of --index and --search"""
+    _index = SearchIndex(args.index)
+    _changed = False
+    for _file in args.xml_files:
+        #Releases of one STIG share its benchmark id, so file them by path too
+        _benchmark = '%s:%s' % (benchmark_id(_file), os.path.abspath(_file))
+        _digest = _file_digest(_file)
+        if _index.is_current(_benchmark, _digest):
+            continue
+        if args.cache:
+            _groups = load_groups(_file, args.cache)
+        else:
+            _groups = read_groups(_file, stream=args.stream)
+        _count = _index.add_benchmark(_groups, _benchmark, _digest)
+        _changed = True
+        logging.info('Indexed %s rules of %s', _count, _benchmark)
+    if _changed:
+        _index.save()
+    if args.search:
+        for _result in _index.search(args.search, args.limit):
+            print('%.3f\t%s\t%s\t%s' % _result)
+    return True
+    
+    
+def _make_sinks(args, benchmark):
+    """ Build the Sinks of main()'s --sink specs
+    
+    Jira sinks on the same URL share one JiraScheduler so they are paced
+    together.
+    
+    Raises:
+        ValueError for a spec that is not jira:, ndjson: or sqlite:
+    """
+    _sinks = []
+    _schedulers = {}
+    for _spec in args.sink:
+        _kind, _sep, _target = _spec.partition(':')
+        if not _target:
+            raise ValueError('bad --sink %s' % _spec)
+        if _kind == 'jira':
+            _project, _sep, _url = _target.partition('@')
+            _url = _url or args.url
+            if _url not in _schedulers:
+                _schedulers[_url] = JiraScheduler(max_retries=args.retries)
+            _sinks.append(JiraSink(_project, args.user, _url, args.concurrency,
+                                   args.bulk, args.reconcile, _schedulers[_url]))
+        elif _kind == 'ndjson':
+            _sinks.append(NdjsonSink(_target, args.project, args.user))
+        elif _kind == 'sqlite':
+            _sinks.append(SqliteSink(_target, benchmark))
+        else:
+            raise ValueError('unknown --sink kind %s' % _kind)
+    return _sinks
+    
+    
+def _finish(args):
+    """Print the run summary and dump the metrics file if one was asked for
+    
+    Modes that write their result to stdout get the summary on stderr so 
+    the output stays machine readable.
+    """
+    _out = sys.stdout
+    if (args.list or args.diff or args.group or args.search or 
+            args.dry_run == '-' or 'ndjson:-' in args.sink):
+        _out = sys.stderr
+    print(metrics.summary(), file=_out)
+    if args.metrics:
+        if args.metrics.endswith('.json'):
+            metrics.write_json(args.metrics)
+        else:
+            metrics.write_prometheus(args.metrics)
+    print("Done!", file=_out)
         
         
 if __name__ == '__main__':
@@ -4,7 +4,10 @@ Test cases for STIG2Jira app
 """
 
 from STIG2Jira import *
+from STIG2Jira import _json_to_jira, _bulk_to_jira, _async_to_jira, _sync_to_jira
+from STIG2Jira import _group_to_fields
 import unittest
+from mock_jira import MockJira
 
 
 class UnitTestCheckCheck(unittest.TestCase):
@@ -223,6 +226,24 @@ class UnitTestCheckRule(unittest.TestCase):
         self.assertTrue(test_rule.reset_weight())
         self.assertTrue(test_rule.weight == weight)
         
+    def test_compact_layout(self):
+        rule_a = StigRule(self.id, self.ver, self.title, self.desc, self.ref, 
+                          self.ident, self.test_fixtext, self.test_fix)
+        rule_b = StigRule(self.id, self.ver, self.title, self.desc, self.ref, 
+                          self.ident, self.test_fixtext, self.test_fix)
+        rule_a.add_check(self.check)
+        self.assertEqual(len(rule_b.checks), 0)
+        for obj in (rule_a, self.ref, self.check, self.ident, self.test_fix,
+                    self.test_fixtext):
+            self.assertFalse(hasattr(obj, '__dict__'))
+        
+    def test_repeated_strings_interned(self):
+        groups = list(iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'))
+        self.assertIs(groups[0].rules[0].REFERENCE.publisher,
+                      groups[1].rules[0].REFERENCE.publisher)
+        self.assertIs(groups[0].rules[0].checks[0].HREF,
+                      groups[1].rules[0].checks[0].HREF)
+        
         
 class UnitTestCheckGroup(unittest.TestCase):
     """All unit test cases for the Group class
@@ -381,6 +402,1226 @@ class TestReadXML(unittest.TestCase):
             tmp_group.add_rule(parse_rules(group_rules))
             stig_groups.append(tmp_group) #append group only after fully built from xml        
 
+
+
+class TestIterGroups(unittest.TestCase):
+    
+    def setUp(self):
+        self.xml_file = 'U_Windows_7_V1R13_STIG_Manual-xccdf.xml'
+        doc = parse(self.xml_file)
+        self.groups = doc.getElementsByTagName('Group')
+        
+    def test_stream_matches_dom(self):
+        streamed = list(iter_groups(self.xml_file))
+        self.assertEqual(len(streamed), len(self.groups))
+        for node, group in zip(self.groups, streamed):
+            dom_group = parse_group(node)
+            self.assertEqual(dom_group.ID, group.ID)
+            self.assertEqual(dom_group.TITLE, group.TITLE)
+            self.assertEqual(dom_group.rules[0].DESCRIPTION, 
+                             group.rules[0].DESCRIPTION)
+            self.assertEqual(dom_group.rules[0].checks[0].CONTENT, 
+                             group.rules[0].checks[0].CONTENT)
+                             
+    def test_read_groups_picks_parser(self):
+        metrics.reset()
+        streamed = list(read_groups(self.xml_file))
+        self.assertNotIn('parse_document_seconds', metrics.to_dict()["histograms"])
+        loaded = list(read_groups(self.xml_file, stream=False))
+        self.assertEqual(diff_benchmarks(streamed, loaded), 
+                         {'added': [], 'removed': [], 'changed': {}})
+        self.assertEqual(metrics.to_dict()["histograms"]["parse_document_seconds"][0]["count"], 1)
+        metrics.reset()
+        self.assertEqual([x.ID for x in read_groups(self.xml_file, 'MAC-1_Classified', 
+                                                    stream=False)],
+                         [x.ID for x in iter_groups(self.xml_file, 'MAC-1_Classified')])
+        self.assertNotIn('parse_document_seconds', metrics.to_dict()["histograms"])
+        with self.assertRaises(Exception):
+            list(read_groups(self.xml_file, 'No_Such_Profile'))
+
+
+class TestParseBenchmarks(unittest.TestCase):
+    
+    def setUp(self):
+        import shutil, tempfile
+        self.xml_file = 'U_Windows_7_V1R13_STIG_Manual-xccdf.xml'
+        self.tmp_dir = tempfile.mkdtemp()
+        for name in ('a-xccdf.xml', 'b-xccdf.xml'):
+            shutil.copy(self.xml_file, os.path.join(self.tmp_dir, name))
+            
+    def test_parse_directory(self):
+        benchmarks = parse_benchmarks(self.tmp_dir, processes=2)
+        self.assertEqual(sorted(benchmarks), 
+                         [os.path.join(self.tmp_dir, 'a-xccdf.xml'),
+                          os.path.join(self.tmp_dir, 'b-xccdf.xml')])
+        for groups in benchmarks.values():
+            self.assertEqual(len(groups), 355)
+            self.assertEqual(groups[0].ID, 'V-1070')
+            
+    def test_parse_file_list(self):
+        benchmarks = parse_benchmarks([self.xml_file])
+        self.assertEqual(list(benchmarks), [self.xml_file])
+        
+    def test_main_directory(self):
+        payloads = os.path.join(self.tmp_dir, 'payloads.ndjson')
+        metrics_file = os.path.join(self.tmp_dir, 'metrics.json')
+        metrics.reset()
+        self.assertTrue(main([self.tmp_dir, '--processes', '2', 
+                              '--dry-run', payloads, '--metrics', metrics_file]))
+        with open(payloads) as f:
+            self.assertEqual(len(f.readlines()), 2 * 355)
+        with open(metrics_file) as f:
+            data = json.load(f)
+        self.assertEqual(data["counters"]["groups_parsed_total"][0]["value"], 2 * 355)
+        self.assertEqual(data["histograms"]["parse_group_seconds"][0]["count"], 2 * 355)
+            
+    def test_main_index_releases(self):
+        path = os.path.join(self.tmp_dir, 'search.idx')
+        self.assertTrue(main([self.tmp_dir, '--index', path]))
+        index = SearchIndex(path)
+        self.assertEqual(len(index.benchmarks), 2)
+        self.assertEqual(len(index), 2 * 355)
+        mtime = os.stat(path).st_mtime_ns
+        self.assertTrue(main([self.tmp_dir, '--index', path]))
+        self.assertEqual(os.stat(path).st_mtime_ns, mtime)
+        
+    def test_main_single_file_modes(self):
+        with self.assertRaises(SystemExit):
+            main([self.tmp_dir, '--group', 'V-1070'])
+        
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir)
+
+
+class FakeResponse(object):
+    """Minimal stand-in for requests.Response"""
+    
+    def __init__(self, status_code=201, body=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(body or {}).encode()
+        
+    def json(self):
+        return json.loads(self.content)
+        
+        
+class RecordingSession(object):
+    """Stand-in for JiraSession that records posts instead of sending them"""
+    
+    def __init__(self, responses=None):
+        self.posts = []
+        self.puts = []
+        self.responses = list(responses or [])
+        
+    def post(self, url, data=None, **kwargs):
+        self.posts.append((url, data))
+        if self.responses:
+            _resp = self.responses.pop(0)
+            if isinstance(_resp, Exception):
+                raise _resp
+            return _resp
+        return FakeResponse(201, {"id": "1", "key": "STIG-%d" % len(self.posts)})
+        
+    def put(self, url, data=None, **kwargs):
+        self.puts.append((url, data))
+        return FakeResponse(204)
+        
+        
+class TestJiraSession(unittest.TestCase):
+    
+    def test_pool_and_timeout(self):
+        session = JiraSession(pool_size=4, timeout=3)
+        adapter = session.get_adapter('https://jira.example.com')
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(session.timeout, 3)
+        self.assertEqual(session.auth, JIRA_AUTH)
+        session.close()
+        
+    def test_no_keep_alive(self):
+        session = JiraSession(keep_alive=False)
+        self.assertEqual(session.headers['Connection'], 'close')
+        session.close()
+        
+    def test_export_uses_session(self):
+        group = next(iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'))
+        session = RecordingSession()
+        self.assertTrue(_json_to_jira(group, '10108', 'user', 
+                                      'http://jira/rest/api/2/issue', session))
+        self.assertEqual(len(session.posts), 1)
+        self.assertEqual(json.loads(session.posts[0][1])['fields']['labels'],
+                         [group.ID, group.rules[0].ID])
+
+
+class TestBulkToJira(unittest.TestCase):
+    
+    def setUp(self):
+        self.groups = list(iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'))[:5]
+        self.url = 'http://jira/rest/api/2/issue/bulk'
+        
+    def test_batches(self):
+        session = RecordingSession([
+            FakeResponse(201, {"issues": [{"key": "STIG-%d" % i} for i in range(2)]}),
+            FakeResponse(201, {"issues": [{"key": "STIG-%d" % i} for i in range(2, 4)]}),
+            FakeResponse(201, {"issues": [{"key": "STIG-4"}]})])
+        created, failed = _bulk_to_jira(self.groups, '10108', 'user', self.url, 
+                                        2, session)
+        self.assertEqual(len(session.posts), 3)
+        self.assertEqual(len(json.loads(session.posts[0][1])['issueUpdates']), 2)
+        self.assertEqual(failed, {})
+        self.assertEqual(created[self.groups[4].ID], 'STIG-4')
+        
+    def test_partial_failure(self):
+        error = {"errors": {"priority": "bad priority"}}
+        session = RecordingSession([FakeResponse(201, {
+            "issues": [{"key": "STIG-1"}, {"key": "STIG-2"}, {"key": "STIG-3"},
+                       {"key": "STIG-4"}],
+            "errors": [{"status": 400, "elementErrors": error, 
+                        "failedElementNumber": 1}]})])
+        created, failed = _bulk_to_jira(self.groups, '10108', 'user', self.url, 
+                                        50, session)
+        self.assertEqual(failed, {self.groups[1].ID: error})
+        self.assertEqual(created[self.groups[0].ID], 'STIG-1')
+        self.assertEqual(created[self.groups[2].ID], 'STIG-2')
+        
+    def test_rejected_batch(self):
+        session = RecordingSession([FakeResponse(401, {})])
+        created, failed = _bulk_to_jira(self.groups, '10108', 'user', self.url, 
+                                        50, session)
+        self.assertEqual(created, {})
+        self.assertEqual(sorted(failed), sorted(x.ID for x in self.groups))
+        
+    def test_rejected_batch_error_collection(self):
+        body = {"errorMessages": [], "errors": {"issuetype": "required"}}
+        session = RecordingSession([FakeResponse(400, body)])
+        created, failed = _bulk_to_jira(self.groups, '10108', 'user', self.url, 
+                                        50, session)
+        self.assertEqual(created, {})
+        self.assertEqual(sorted(failed), sorted(x.ID for x in self.groups))
+        self.assertIn('HTTP 400', failed[self.groups[0].ID])
+        self.assertIn('issuetype', failed[self.groups[0].ID])
+
+
+class SlowSession(RecordingSession):
+    """RecordingSession that holds each post open and tracks concurrency"""
+    
+    def __init__(self, delay=0.02):
+        import threading
+        RecordingSession.__init__(self)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        
+    def post(self, url, data=None, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return RecordingSession.post(self, url, data, **kwargs)
+        
+        
+class TestAsyncToJira(unittest.TestCase):
+    
+    def setUp(self):
+        self.groups = list(iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'))[:20]
+        self.url = 'http://jira/rest/api/2/issue'
+        
+    def test_bounded_concurrency(self):
+        session = SlowSession()
+        results = _async_to_jira(iter(self.groups), '10108', 'user', self.url, 
+                                 4, session)
+        self.assertEqual(len(session.posts), 20)
+        self.assertEqual(session.max_in_flight, 4)
+        self.assertEqual(sorted(results), sorted(x.ID for x in self.groups))
+        self.assertTrue(all(x is True for x in results.values()))
+        
+    def test_failure_reported_per_group(self):
+        self.groups[3].rules.append(self.groups[3].rules[0])
+        results = _async_to_jira(self.groups, '10108', 'user', self.url, 
+                                 4, RecordingSession())
+        self.assertIsInstance(results[self.groups[3].ID], ValueError)
+        self.assertTrue(results[self.groups[4].ID])
+
+
+class TestJiraScheduler(unittest.TestCase):
+    
+    def setUp(self):
+        self.group = next(iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'))
+        self.url = 'http://jira/rest/api/2/issue'
+        
+    def test_retry_until_created(self):
+        scheduler = JiraScheduler(base_delay=0.001)
+        session = RecordingSession([FakeResponse(429), FakeResponse(503), 
+                                    FakeResponse(201)])
+        self.assertTrue(_json_to_jira(self.group, '10108', 'user', self.url,
+                                      session, scheduler))
+        self.assertEqual(len(session.posts), 3)
+        self.assertEqual(scheduler.retries, 2)
+        self.assertEqual(scheduler.outcomes[self.group.ID], (201, 3))
+        
+    def test_honors_retry_after(self):
+        scheduler = JiraScheduler(base_delay=0.001)
+        session = RecordingSession([FakeResponse(429, headers={'Retry-After': '0.2'}),
+                                    FakeResponse(201)])
+        started = time.time()
+        self.assertTrue(_json_to_jira(self.group, '10108', 'user', self.url,
+                                      session, scheduler))
+        self.assertGreaterEqual(time.time() - started, 0.2)
+        
+    def test_gives_up(self):
+        scheduler = JiraScheduler(max_retries=1, base_delay=0.001)
+        session = RecordingSession([FakeResponse(503)] * 3)
+        self.assertFalse(_json_to_jira(self.group, '10108', 'user', self.url,
+                                       session, scheduler))
+        self.assertEqual(scheduler.outcomes[self.group.ID], (503, 2))
+        
+    def test_client_error_not_retried(self):
+        scheduler = JiraScheduler(base_delay=0.001)
+        session = RecordingSession([FakeResponse(400), FakeResponse(201)])
+        self.assertFalse(_json_to_jira(self.group, '10108', 'user', self.url,
+                                       session, scheduler))
+        self.assertEqual(len(session.posts), 1)
+        
+    def test_create_not_retried_once_sent(self):
+        for failure in (requests.ReadTimeout(), FakeResponse(502), 
+                        FakeResponse(504),
+                        requests.ConnectionError('Connection aborted.')):
+            scheduler = JiraScheduler(base_delay=0.001)
+            session = RecordingSession([failure, FakeResponse(201)])
+            try:
+                ok = _json_to_jira(self.group, '10108', 'user', self.url,
+                                   session, scheduler)
+            except requests.RequestException:
+                ok = False
+            self.assertFalse(ok)
+            self.assertEqual(len(session.posts), 1)
+            
+    def test_unsent_create_retried(self):
+        scheduler = JiraScheduler(base_delay=0.001)
+        session = RecordingSession([requests.ConnectTimeout(), FakeResponse(201)])
+        self.assertTrue(_json_to_jira(self.group, '10108', 'user', self.url,
+                                      session, scheduler))
+        self.assertEqual(len(session.posts), 2)
+        
+    def test_idempotent_retried(self):
+        scheduler = JiraScheduler(base_delay=0.001)
+        session = RecordingSession([requests.ReadTimeout(), FakeResponse(502),
+                                    FakeResponse(200)])
+        resp = scheduler.post(session, self.url, '{}', idempotent=True)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(session.posts), 3)
+        
+    def test_throttling_slows_rate(self):
+        scheduler = JiraScheduler(base_delay=0.01)
+        scheduler._adapt(429)
+        scheduler._adapt(429)
+        self.assertGreater(scheduler.interval, 0)
+        throttled = scheduler.interval
+        scheduler._adapt(201)
+        self.assertLess(scheduler.interval, throttled)
+
+
+class TestSyncToJira(unittest.TestCase):
+    
+    def setUp(self):
+        import tempfile
+        self.groups = list(iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'))[:3]
+        self.url = 'http://jira/rest/api/2/issue'
+        handle, self.state_file = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        os.remove(self.state_file)
+        
+    def test_fingerprint(self):
+        rule = self.groups[0].rules[0]
+        fingerprint = fingerprint_rule(rule)
+        self.assertEqual(fingerprint, fingerprint_rule(rule))
+        rule.change_severity('low')
+        self.assertNotEqual(fingerprint, fingerprint_rule(rule))
+        rule.reset_severity()
+        self.assertEqual(fingerprint, fingerprint_rule(rule))
+        
+    def test_incremental_sync(self):
+        session = RecordingSession()
+        report = _sync_to_jira(self.groups, '10108', 'user', self.url,
+                               SyncState(self.state_file), session)
+        self.assertEqual(report['created'], [x.ID for x in self.groups])
+        
+        session = RecordingSession()
+        report = _sync_to_jira(self.groups, '10108', 'user', self.url,
+                               SyncState(self.state_file), session)
+        self.assertEqual(len(report['unchanged']), 3)
+        self.assertEqual(session.posts, [])
+        
+        self.groups[0].rules[0].DESCRIPTION += ' Updated.'
+        state = SyncState(self.state_file)
+        closed_key = state.groups[self.groups[2].ID]['key']
+        session = RecordingSession([FakeResponse(204)])
+        report = _sync_to_jira(self.groups[:2], '10108', 'user', self.url,
+                               state, session)
+        self.assertEqual(report['updated'], [self.groups[0].ID])
+        self.assertEqual(report['closed'], [self.groups[2].ID])
+        self.assertEqual(report['unchanged'], [self.groups[1].ID])
+        self.assertEqual(session.puts[0][0], 
+                         self.url + '/' + state.groups[self.groups[0].ID]['key'])
+        self.assertEqual(session.posts[0][0], 
+                         self.url + '/' + closed_key + '/transitions')
+        self.assertEqual(sorted(SyncState(self.state_file).groups),
+                         sorted(x.ID for x in self.groups[:2]))
+                         
+    def tearDown(self):
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+
+
+class TestExportJournal(unittest.TestCase):
+    
+    def setUp(self):
+        import tempfile
+        self.groups = list(iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'))[:4]
+        self.url = 'http://jira/rest/api/2/issue'
+        handle, self.journal_file = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        
+    def test_resume_skips_completed(self):
+        session = RecordingSession([FakeResponse(201, {"key": "STIG-1"}),
+                                    FakeResponse(400)])
+        with ExportJournal(self.journal_file) as journal:
+            for group in self.groups[:2]:
+                _json_to_jira(group, '10108', 'user', self.url, session, 
+                              JiraScheduler(), journal)
+        #simulate a crash in the middle of writing the next entry
+        with open(self.journal_file, 'a') as f:
+            f.write('{"group": "V-10')
+        with ExportJournal(self.journal_file) as journal:
+            self.assertEqual(journal.completed, {self.groups[0].ID: 'STIG-1'})
+            pending = [x.ID for x in journal.pending(self.groups)]
+            journal.record(self.groups[1].ID, True, 201, 'STIG-2')
+        self.assertEqual(pending, [x.ID for x in self.groups[1:]])
+        self.assertEqual(ExportJournal(self.journal_file).completed[self.groups[1].ID],
+                         'STIG-2')
+        
+    def test_bulk_and_async_record(self):
+        session = RecordingSession([FakeResponse(201, {"issues": [
+            {"key": "STIG-1"}, {"key": "STIG-2"}]})])
+        with ExportJournal(self.journal_file) as journal:
+            _bulk_to_jira(self.groups[:2], '10108', 'user', self.url + '/bulk',
+                          50, session, JiraScheduler(), journal)
+            _async_to_jira(journal.pending(self.groups), '10108', 'user', 
+                           self.url, 2, RecordingSession(), JiraScheduler(), 
+                           journal)
+        self.assertEqual(sorted(ExportJournal(self.journal_file).completed),
+                         sorted(x.ID for x in self.groups))
+                         
+    def test_sync_rejects_journal(self):
+        for extra in (['--journal', self.journal_file], 
+                      ['--journal', self.journal_file, '--resume']):
+            with self.assertRaises(SystemExit):
+                main(['--sync', 'state.json'] + extra)
+                
+    def tearDown(self):
+        os.remove(self.journal_file)
+
+
+class TestLoadGroups(unittest.TestCase):
+    
+    def setUp(self):
+        import tempfile
+        self.xml_file = 'U_Windows_7_V1R13_STIG_Manual-xccdf.xml'
+        self.cache_dir = tempfile.mkdtemp()
+        
+    def test_warm_load(self):
+        cold = load_groups(self.xml_file, self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        warm = load_groups(self.xml_file, self.cache_dir)
+        self.assertEqual([x.ID for x in cold], [x.ID for x in warm])
+        self.assertEqual(cold[5].rules[0].FIXTEXT.content, 
+                         warm[5].rules[0].FIXTEXT.content)
+        
+    def test_changed_file_misses(self):
+        import shutil
+        load_groups(self.xml_file, self.cache_dir)
+        changed = os.path.join(self.cache_dir, 'changed.xml')
+        shutil.copy(self.xml_file, changed)
+        with open(changed, 'a') as f:
+            f.write('\n')
+        load_groups(changed, self.cache_dir)
+        entries = [x for x in os.listdir(self.cache_dir) if x.endswith('.pickle')]
+        self.assertEqual(len(entries), 2)
+        
+    def test_size_bound(self):
+        import shutil
+        changed = os.path.join(self.cache_dir, 'changed.xml')
+        shutil.copy(self.xml_file, changed)
+        with open(changed, 'a') as f:
+            f.write('\n')
+        load_groups(self.xml_file, self.cache_dir)
+        load_groups(changed, self.cache_dir, max_bytes=1)
+        self.assertEqual([x for x in os.listdir(self.cache_dir) 
+                          if x.endswith('.pickle')], [])
+        
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.cache_dir)
+
+
+class TestStigBenchmark(unittest.TestCase):
+    
+    def setUp(self):
+        self.benchmark = load_benchmark('U_Windows_7_V1R13_STIG_Manual-xccdf.xml')
+        
+    def test_lookups(self):
+        self.assertEqual(self.benchmark.ID, 'Windows_7_STIG')
+        self.assertEqual(len(self.benchmark), 355)
+        group = self.benchmark.get_group('V-1070')
+        self.assertEqual(group.TITLE, 'Physical security')
+        rule = self.benchmark.get_rule('SV-24996r1_rule')
+        self.assertIs(rule, group.rules[0])
+        self.assertIs(self.benchmark.get_group_for_rule(rule.ID), group)
+        self.assertIs(self.benchmark.get_rule_by_version('1.001'), rule)
+        self.assertIsNone(self.benchmark.get_group('V-0'))
+        self.assertIsNone(self.benchmark.get_rule('SV-0'))
+        
+    def test_ident_and_severity(self):
+        idents = [x.rules[0].IDENT for x in self.benchmark 
+                  if x.rules[0].IDENT is not None]
+        self.assertTrue(len(idents) > 0)
+        self.assertIn(idents[0].content, 
+                      [x.IDENT.content for x in 
+                       self.benchmark.find_by_ident(idents[0].content)])
+        total = sum(len(self.benchmark.find_by_severity(x)) 
+                    for x in ('high', 'medium', 'low'))
+        self.assertEqual(total, 355)
+        
+    def test_reindex(self):
+        rule = self.benchmark.get_rule('SV-24996r1_rule')
+        rule.change_severity('low')
+        self.assertNotIn(rule, self.benchmark.find_by_severity('low'))
+        self.benchmark.reindex()
+        self.assertIn(rule, self.benchmark.find_by_severity('low'))
+        
+    def test_duplicate_group(self):
+        with self.assertRaises(Exception):
+            self.benchmark.add_group(self.benchmark.get_group('V-1070'))
+
+
+class TestProfileSelection(unittest.TestCase):
+    
+    def setUp(self):
+        self.xml_file = 'U_Windows_7_V1R13_STIG_Manual-xccdf.xml'
+        doc = parse(self.xml_file)
+        self.profiles = dict((x.getAttribute('id'), parse_profile(x)) 
+                             for x in doc.getElementsByTagName('Profile'))
+        
+    def test_parse_profile(self):
+        self.assertEqual(len(self.profiles), 9)
+        self.assertEqual(len(self.profiles['MAC-1_Classified']), 354)
+        self.assertIn('V-1070', self.profiles['MAC-1_Classified'])
+        
+    def test_only_selected_groups(self):
+        all_ids = [x.ID for x in iter_groups(self.xml_file)]
+        selected = [x.ID for x in iter_groups(self.xml_file, 'MAC-1_Classified')]
+        self.assertEqual(selected, [x for x in all_ids 
+                                    if x in self.profiles['MAC-1_Classified']])
+        self.assertEqual(len(selected), 354)
+        
+    def test_unknown_profile(self):
+        with self.assertRaises(Exception):
+            next(iter_groups(self.xml_file, 'MAC-9_Unknown'))
+
+
+class TestWriteReport(unittest.TestCase):
+    
+    def setUp(self):
+        import itertools
+        self.groups = list(itertools.islice(
+            iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'), 5))
+            
+    def test_html_escaped(self):
+        import io
+        out = io.StringIO()
+        self.assertEqual(write_report(self.groups, out, 'html'), 5)
+        self.assertNotIn('<VulnDiscussion>', out.getvalue())
+        self.assertIn('&lt;VulnDiscussion&gt;', out.getvalue())
+        self.assertTrue(out.getvalue().rstrip().endswith('</html>'))
+        
+    def test_markdown(self):
+        import io
+        out = io.StringIO()
+        write_report(self.groups, out, 'md')
+        self.assertIn('## V-1070 Physical security', out.getvalue())
+        self.assertIn('| ID | SV-24996r1\\_rule |', out.getvalue())
+        
+    def test_csv_round_trip(self):
+        import csv, io
+        out = io.StringIO()
+        write_report(self.groups, out, 'csv')
+        rows = list(csv.reader(io.StringIO(out.getvalue())))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][0], 'V-1070')
+        self.assertEqual(rows[1][rows[0].index('Description')], 
+                         self.groups[0].rules[0].DESCRIPTION)
+                         
+    def test_print_to_html(self):
+        import tempfile
+        handle, path = tempfile.mkstemp(suffix='.html')
+        os.close(handle)
+        self.assertTrue(printToHTML(self.groups, path))
+        with open(path) as f:
+            self.assertIn('V-1070', f.read())
+        os.remove(path)
+
+
+class TestDiffBenchmarks(unittest.TestCase):
+    
+    def setUp(self):
+        self.xml_file = 'U_Windows_7_V1R13_STIG_Manual-xccdf.xml'
+        self.old = list(iter_groups(self.xml_file))
+        self.new = list(iter_groups(self.xml_file))
+        
+    def test_identical(self):
+        self.assertEqual(diff_benchmarks(self.old, self.new),
+                         {"added": [], "removed": [], "changed": {}})
+                         
+    def test_changes(self):
+        removed = self.new.pop(0)
+        added = StigGroup('V-99999', 'New group', '')
+        self.new.append(added)
+        rule = self.new[0].rules[0]
+        old_severity = rule.severity
+        rule.change_severity('high' if old_severity != 'high' else 'low')
+        rule.checks[0].CONTENT = 'New check content'
+        #a re-issued rule ID with the same content is not a change
+        self.new[1].rules[0].ID = self.new[1].rules[0].ID.replace('r1_', 'r2_')
+        diff = diff_benchmarks(self.old, self.new)
+        self.assertEqual(diff['added'], ['V-99999'])
+        self.assertEqual(diff['removed'], [removed.ID])
+        self.assertEqual(list(diff['changed']), [self.new[0].ID])
+        fields = diff['changed'][self.new[0].ID][rule.VERSION]
+        self.assertEqual(sorted(fields), ['checks', 'severity'])
+        self.assertEqual(fields['severity'], (old_severity, rule.severity))
+        self.assertEqual(fields['checks'][1], ['New check content'])
+        
+    def test_rule_added_and_removed(self):
+        old_rule = self.new[0].rules[0]
+        self.new[0].rules = [StigRule(old_rule.ID, '9.999', old_rule.TITLE, 
+                                      old_rule.DESCRIPTION, old_rule.REFERENCE,
+                                      old_rule.IDENT, old_rule.FIXTEXT, 
+                                      old_rule.FIX)]
+        changes = diff_benchmarks(self.old, self.new)['changed'][self.new[0].ID]
+        self.assertEqual(changes['9.999'], {'rule': (None, old_rule.ID)})
+        self.assertEqual(changes[old_rule.VERSION], {'rule': (old_rule.ID, None)})
+
+
+class TestMockJira(unittest.TestCase):
+    
+    def setUp(self):
+        import itertools
+        self.groups = list(itertools.islice(
+            iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'), 10))
+        self.mock = MockJira(seed=1).start()
+        self.session = JiraSession()
+        
+    def test_create_and_search(self):
+        for group in self.groups:
+            self.assertTrue(_json_to_jira(group, '10108', 'user', 
+                                          self.mock.issue_url, self.session,
+                                          JiraScheduler()))
+        self.assertEqual(len(self.mock.issues), 10)
+        resp = self.session.post(self.mock.url + '/rest/api/2/search', 
+                                 data=json.dumps({
+                                     'jql': 'project = 10108 AND labels in ("%s", "%s")' 
+                                            % (self.groups[0].ID, self.groups[1].ID),
+                                     'maxResults': 1, 'fields': ['labels']}))
+        body = resp.json()
+        self.assertEqual(body['total'], 2)
+        self.assertEqual(len(body['issues']), 1)
+        self.assertEqual(list(body['issues'][0]['fields']), ['labels'])
+        
+    def test_bulk(self):
+        created, failed = _bulk_to_jira(self.groups, '10108', 'user', 
+                                        self.mock.issue_url + '/bulk', 4,
+                                        self.session, JiraScheduler())
+        self.assertEqual(failed, {})
+        self.assertEqual(sorted(created.values()), sorted(self.mock.issues))
+        self.assertEqual(len(self.mock.requests), 3)
+        
+    def test_throttled_export_completes(self):
+        self.mock.throttle_rate = 0.3
+        self.mock.error_rate = 0.1
+        self.mock.retry_after = 0
+        scheduler = JiraScheduler(max_retries=20, base_delay=0.001, max_delay=0.01)
+        results = _async_to_jira(self.groups, '10108', 'user', 
+                                 self.mock.issue_url, 4, self.session, scheduler)
+        self.assertTrue(all(x is True for x in results.values()))
+        self.assertEqual(len(self.mock.issues), 10)
+        self.assertGreater(self.mock.responses.get(429, 0), 0)
+        self.assertEqual(scheduler.retries, len(self.mock.requests) - 10)
+        
+    def test_sync_update_and_close(self):
+        import tempfile
+        handle, state_file = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        os.remove(state_file)
+        _sync_to_jira(self.groups, '10108', 'user', self.mock.issue_url,
+                      SyncState(state_file), self.session, JiraScheduler())
+        self.groups[0].rules[0].TITLE = 'Changed title'
+        report = _sync_to_jira(self.groups[:-1], '10108', 'user', 
+                               self.mock.issue_url, SyncState(state_file), 
+                               self.session, JiraScheduler())
+        self.assertEqual(len(report['updated']), 1)
+        self.assertEqual(len(report['closed']), 1)
+        statuses = sorted(x['fields']['status']['name'] 
+                          for x in self.mock.issues.values())
+        self.assertEqual(statuses, ['Closed'] + ['Open'] * 9)
+        os.remove(state_file)
+        
+    def tearDown(self):
+        self.session.close()
+        self.mock.stop()
+
+
+class TestPriorityPolicy(unittest.TestCase):
+    
+    def setUp(self):
+        self.benchmark = StigBenchmark(
+            iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'))
+            
+    def test_default_policy(self):
+        policy = PriorityPolicy()
+        self.assertEqual(policy.priority('high', '10.0'), 1)
+        self.assertEqual(policy.priority('medium', '7'), 2)
+        self.assertEqual(policy.priority('low', '5'), 2)
+        self.assertEqual(policy.priority('low', '6'), 3)
+        self.assertEqual(policy.priority('medium', '13'), 5)
+        with self.assertRaises(KeyError):
+            policy.priority('unknown', '10')
+            
+    def test_batch_matches_single(self):
+        policy = PriorityPolicy()
+        priorities = self.benchmark.priorities(policy)
+        self.assertEqual(len(priorities), 355)
+        for group in self.benchmark:
+            rule = group.rules[0]
+            self.assertEqual(priorities[rule.ID], 
+                             policy.priority(rule.severity, rule.weight))
+            
+    def test_override_and_reconfigure(self):
+        policy = PriorityPolicy()
+        rule = self.benchmark.groups[0].rules[0]
+        rule.change_severity('low')
+        rule.change_weight('9')
+        self.assertEqual(self.benchmark.priorities(policy)[rule.ID], 5)
+        rule.reset_severity()
+        rule.reset_weight()
+        self.assertEqual(self.benchmark.priorities(policy)[rule.ID], 3)
+        policy.configure({'high': 3, 'medium': 2, 'low': 1}, (5, 35))
+        self.assertEqual(self.benchmark.priorities(policy)[rule.ID], 2)
+        fields = _group_to_fields(self.benchmark.groups[0], '10108', 'user', 
+                                  policy)
+        self.assertEqual(fields['priority'], {'id': '2'})
+        
+        
+class TestWriteTables(unittest.TestCase):
+    
+    def setUp(self):
+        import tempfile
+        self.directory = tempfile.mkdtemp()
+        self.groups = list(iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'))
+        
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.directory)
+        
+    def test_round_trip(self):
+        counts = write_tables(self.groups, self.directory, 'Windows_7_STIG',
+                              batch_size=100)
+        self.assertEqual(counts, {'groups': 355, 'rules': 355, 'checks': 355,
+                                  'references': 355})
+        tables = read_tables(self.directory)
+        rules = tables['rules']
+        rule = self.groups[0].rules[0]
+        self.assertEqual(rules['rule_id'][0], rule.ID)
+        self.assertEqual(rules['group_id'][0], self.groups[0].ID)
+        self.assertEqual(rules['weight'][0], float(rule.weight))
+        self.assertEqual(rules['fixtext'][0], rule.FIXTEXT.content)
+        self.assertEqual(tables['checks']['content'][0], rule.checks[0].CONTENT)
+        self.assertEqual(tables['checks']['check_index'][0], 0)
+        self.assertEqual(tables['references']['identifier'][0], 
+                         rule.REFERENCE.identifier)
+        self.assertEqual(set(tables['groups']['benchmark']), set(['Windows_7_STIG']))
+        
+    def test_append(self):
+        write_tables(self.groups[:5], self.directory, 'a')
+        write_tables(self.groups[5:8], self.directory, 'b', append=True)
+        tables = read_tables(self.directory)
+        self.assertEqual(tables['groups']['benchmark'], ['a'] * 5 + ['b'] * 3)
+        
+        
+class TestSearchIndex(unittest.TestCase):
+    
+    def setUp(self):
+        self.groups = list(iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'))
+        self.index = SearchIndex()
+        self.index.add_benchmark(self.groups, 'win7')
+        
+    def test_phrase(self):
+        results = self.index.search('\\System\\CurrentControlSet\\Control\\Lsa', None)
+        self.assertGreater(len(results), 0)
+        rules = dict((x.rules[0].ID, x.rules[0]) for x in self.groups)
+        for score, benchmark, group_id, rule_id in results:
+            rule = rules[rule_id]
+            text = ' '.join([rule.DESCRIPTION or '', rule.FIXTEXT.content or ''] + 
+                            [x.CONTENT or '' for x in rule.checks])
+            self.assertIn('system\\currentcontrolset\\control\\lsa', text.lower())
+        self.assertEqual(results, sorted(results, key=lambda x: -x[0]))
+        
+    def test_keywords_and_quotes(self):
+        both = self.index.search('"audit policy" success', None)
+        phrase = self.index.search('"audit policy"', None)
+        self.assertGreater(len(both), 0)
+        self.assertTrue(set(x[3] for x in both) < set(x[3] for x in phrase))
+        self.assertEqual(self.index.search('policy audit', None), 
+                         self.index.search('audit policy', None))
+        self.assertEqual(self.index.search('nosuchtermanywhere'), [])
+        self.assertEqual(self.index.search(''), [])
+        
+    def test_incremental_and_persisted(self):
+        import tempfile
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        os.remove(path)
+        index = SearchIndex(path)
+        index.add_benchmark(self.groups[:10], 'a', 'd1')
+        index.add_benchmark(self.groups[10:20], 'b', 'd2')
+        index.save()
+        index = SearchIndex(path)
+        os.remove(path)
+        self.assertEqual(len(index), 20)
+        self.assertTrue(index.is_current('a', 'd1'))
+        self.assertFalse(index.is_current('a', 'd3'))
+        index.add_benchmark(self.groups[:2], 'a', 'd3')
+        self.assertEqual(len(index), 12)
+        self.assertEqual(set(x[1] for x in index.search('the', None)), set(['a', 'b']))
+        index.remove_benchmark('b')
+        self.assertEqual(len(index.search('the', None)), 2)
+        
+    def test_reindex_compacts(self):
+        import tempfile
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        os.remove(path)
+        index = SearchIndex(path)
+        index.add_benchmark(self.groups[:30], 'other')
+        expected = index.search('registry', None)
+        for i in range(4):
+            index.add_benchmark(self.groups, 'win7', str(i))
+            index.save()
+        index = SearchIndex(path)
+        os.remove(path)
+        self.assertEqual(len(index._docs), len(self.groups) + 30)
+        self.assertEqual(len(index), len(self.groups) + 30)
+        self.assertEqual(sorted(x[3] for x in index.search('"audit policy"', None)
+                                if x[1] == 'win7'), 
+                         sorted(x[3] for x in self.index.search('"audit policy"', None)))
+        index.remove_benchmark('win7')
+        self.assertEqual(index.search('registry', None), expected)
+        
+        
+class TestLazyGroups(unittest.TestCase):
+    
+    def setUp(self):
+        self.xml = 'U_Windows_7_V1R13_STIG_Manual-xccdf.xml'
+        self.lazy = list(iter_lazy_groups(self.xml))
+        self.groups = list(iter_groups(self.xml))
+        
+    def test_headers(self):
+        self.assertEqual([(x.ID, x.TITLE) for x in self.lazy], 
+                         [(x.ID, x.TITLE) for x in self.groups])
+        self.assertEqual([(x.rules[0].ID, x.rules[0].severity, x.rules[0].weight) 
+                          for x in self.lazy],
+                         [(x.rules[0].ID, x.rules[0].severity, x.rules[0].weight) 
+                          for x in self.groups])
+                         
+    def test_materialize_on_access(self):
+        lazy, group = self.lazy[5], self.groups[5]
+        rule = lazy.rules[0]
+        self.assertRaises(AttributeError, object.__getattribute__, rule, 'DESCRIPTION')
+        rule.change_severity('low')
+        self.assertEqual(rule.FIXTEXT.content, group.rules[0].FIXTEXT.content)
+        self.assertEqual(rule.DESCRIPTION, group.rules[0].DESCRIPTION)
+        self.assertEqual(rule.checks[0].CONTENT, group.rules[0].checks[0].CONTENT)
+        self.assertEqual(lazy.DESCRIPTION, group.DESCRIPTION)
+        self.assertEqual(rule.severity, 'low')
+        self.assertEqual(rule._DISA_SEVERITY, group.rules[0].severity)
+        
+    def test_payloads_match(self):
+        self.assertEqual(list(iter_payloads(self.lazy, '10108', 'user')),
+                         list(iter_payloads(self.groups, '10108', 'user')))
+                         
+    def test_profile(self):
+        self.assertEqual([x.ID for x in iter_lazy_groups(self.xml, 'MAC-1_Classified')],
+                         [x.ID for x in iter_groups(self.xml, 'MAC-1_Classified')])
+        with self.assertRaises(Exception):
+            list(iter_lazy_groups(self.xml, 'No_Such_Profile'))
+            
+    def test_scan_groups(self):
+        ranges = scan_groups(self.xml)
+        self.assertEqual([x[0] for x in ranges], [x.ID for x in self.groups])
+        group_id, start, end = ranges[-1]
+        self.assertEqual(read_group(self.xml, start, end).rules[0].TITLE,
+                         self.groups[-1].rules[0].TITLE)
+                         
+                         
+class TestGroupIndex(unittest.TestCase):
+    
+    def setUp(self):
+        import tempfile
+        handle, self.path = tempfile.mkstemp(suffix='.idx')
+        os.close(handle)
+        os.remove(self.path)
+        self.xml = 'U_Windows_7_V1R13_STIG_Manual-xccdf.xml'
+        
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+            
+    def test_get(self):
+        groups = list(iter_groups(self.xml))
+        with GroupIndex(self.xml, self.path) as index:
+            self.assertEqual(len(index), len(groups))
+            self.assertTrue(os.path.exists(self.path))
+            for group in (groups[0], groups[100], groups[-1]):
+                fetched = index.get(group.ID)
+                self.assertEqual(fetched.TITLE, group.TITLE)
+                self.assertEqual(fetched.rules[0].DESCRIPTION, 
+                                 group.rules[0].DESCRIPTION)
+                self.assertEqual(fetched.rules[0].checks[0].CONTENT, 
+                                 group.rules[0].checks[0].CONTENT)
+            self.assertIsNone(index.get('V-0'))
+            
+    def test_side_car_reused_and_refreshed(self):
+        GroupIndex(self.xml, self.path).close()
+        with open(self.path) as f:
+            side_car = json.load(f)
+        side_car['groups']['V-1070'] = [0, 1]
+        with open(self.path, 'w') as f:
+            json.dump(side_car, f)
+        with GroupIndex(self.xml, self.path) as index:
+            self.assertEqual(index.ranges['V-1070'], (0, 1))
+        side_car['stamp'] = [0, 0]
+        with open(self.path, 'w') as f:
+            json.dump(side_car, f)
+        with GroupIndex(self.xml, self.path) as index:
+            self.assertEqual(index.get('V-1070').ID, 'V-1070')
+            
+    def test_new_release_at_same_path(self):
+        import tempfile
+        import shutil
+        directory = tempfile.mkdtemp()
+        try:
+            xml = os.path.join(directory, 'stig.xml')
+            with open(self.xml, 'rb') as f:
+                text = f.read()
+            with open(xml, 'wb') as f:
+                f.write(text)
+            index = GroupIndex(xml)
+            self.assertEqual(index.get('V-1070').TITLE, 'Physical security')
+            self.assertTrue(next(iter_lazy_groups(xml)).rules[0].TITLE)
+            text = text.replace(b'<title>Physical security</title>', 
+                                b'<title>Physical protection</title>')
+            with open(xml + '.new', 'wb') as f:
+                f.write(b'<!-- release 2 -->' + text)
+            os.replace(xml + '.new', xml)
+            self.assertEqual(index.get('V-1070').TITLE, 'Physical protection')
+            index.close()
+            group_id, start, end = scan_groups(xml)[0]
+            self.assertEqual(read_group(xml, start, end).TITLE, 'Physical protection')
+        finally:
+            shutil.rmtree(directory)
+            
+            
+class TestReconcile(unittest.TestCase):
+    
+    def setUp(self):
+        import itertools
+        self.groups = list(itertools.islice(
+            iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'), 10))
+        self.mock = MockJira(seed=1).start()
+        self.session = JiraSession()
+        self.search_url = self.mock.url + '/rest/api/2/search'
+        for group in self.groups[:5]:
+            _json_to_jira(group, '10108', 'user', self.mock.issue_url, 
+                          self.session, JiraScheduler())
+        #Same labels in another project must not count
+        _json_to_jira(self.groups[7], '20000', 'user', self.mock.issue_url, 
+                      self.session, JiraScheduler())
+        self.mock.requests = []
+        
+    def tearDown(self):
+        self.session.close()
+        self.mock.stop()
+        
+    def test_search_labels_paginates(self):
+        found = search_labels([x.ID for x in self.groups], '10108', 
+                              self.search_url, self.session, JiraScheduler(),
+                              page_size=2)
+        self.assertEqual(sorted(found), sorted(x.ID for x in self.groups[:5]))
+        self.assertEqual(sorted(found.values()), sorted(
+            x for x in self.mock.issues 
+            if self.mock.issues[x]['fields']['project']['id'] == '10108'))
+        self.assertEqual(len(self.mock.requests), 3)
+        
+    def test_iter_missing(self):
+        existing = {}
+        missing = list(iter_missing(self.groups, '10108', self.search_url,
+                                    self.session, JiraScheduler(), existing, 4))
+        self.assertEqual(missing, self.groups[5:])
+        self.assertEqual(sorted(existing), sorted(x.ID for x in self.groups[:5]))
+        self.assertEqual(len(self.mock.requests), 3)
+        
+        
+class BrokenSink(Sink):
+    """Sink that gives up after the first group"""
+    name = 'broken'
+    
+    def consume(self, groups):
+        next(iter(groups))
+        raise ValueError('disk full')
+        
+        
+class TestFanOut(unittest.TestCase):
+    
+    def setUp(self):
+        import itertools
+        import tempfile
+        self.groups = list(itertools.islice(
+            iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'), 20))
+        self.directory = tempfile.mkdtemp()
+        self.mock = MockJira(seed=1).start()
+        
+    def tearDown(self):
+        import shutil
+        self.mock.stop()
+        shutil.rmtree(self.directory)
+        
+    def test_fan_out(self):
+        import sqlite3
+        ndjson = os.path.join(self.directory, 'issues.ndjson')
+        database = os.path.join(self.directory, 'stig.db')
+        scheduler = JiraScheduler()
+        sinks = [JiraSink('10108', 'user', self.mock.issue_url, 4, 
+                          scheduler=scheduler),
+                 JiraSink('20000', 'user', self.mock.issue_url, bulk=8, 
+                          scheduler=scheduler),
+                 NdjsonSink(ndjson, '10108', 'user'),
+                 SqliteSink(database, 'win7', batch_size=7),
+                 BrokenSink()]
+        results = fan_out(iter(self.groups), sinks, queue_size=2)
+        self.assertEqual(results[0], {'created': 20, 'skipped': 0, 'failed': {}})
+        self.assertEqual(results[1]['created'], 20)
+        self.assertEqual(results[2], {'written': 20})
+        self.assertEqual(results[3], {'groups': 20, 'rules': 20, 'checks': 20,
+                                      'references': 20})
+        self.assertIsInstance(results[4], ValueError)
+        projects = sorted(x['fields']['project']['id'] for x in self.mock.issues.values())
+        self.assertEqual(projects, ['10108'] * 20 + ['20000'] * 20)
+        self.assertEqual(len(list(read_payloads(ndjson))), 20)
+        db = sqlite3.connect(database)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM "references"').fetchone()[0], 20)
+        db.close()
+        #Archiving the same benchmark again replaces its rows
+        fan_out(self.groups, [SqliteSink(database, 'win7')])
+        db = sqlite3.connect(database)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM rules').fetchone()[0], 20)
+        db.close()
+        
+    def test_aborted_parse_keeps_old_output(self):
+        import sqlite3
+        ndjson = os.path.join(self.directory, 'issues.ndjson')
+        database = os.path.join(self.directory, 'stig.db')
+        fan_out(self.groups, [NdjsonSink(ndjson, '10108', 'user'),
+                              SqliteSink(database, 'win7', batch_size=3)])
+        with open(ndjson) as f:
+            before = f.read()
+            
+        def failing():
+            for group in self.groups[:10]:
+                yield group
+            raise ValueError('bad XML')
+            
+        sinks = [NdjsonSink(ndjson, '10108', 'user'), 
+                 SqliteSink(database, 'win7', batch_size=3)]
+        with self.assertRaises(ValueError):
+            fan_out(failing(), sinks, queue_size=2)
+        with open(ndjson) as f:
+            self.assertEqual(f.read(), before)
+        self.assertFalse(os.path.exists(ndjson + '.tmp'))
+        db = sqlite3.connect(database)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM rules').fetchone()[0], 20)
+        db.close()
+        
+    def test_reconcile_sink(self):
+        fan_out(self.groups[:5], [JiraSink('10108', 'user', self.mock.issue_url)])
+        results = fan_out(self.groups, [JiraSink('10108', 'user', self.mock.issue_url,
+                                                 reconcile=True)])
+        self.assertEqual(results[0]['created'], 15)
+        self.assertEqual(results[0]['skipped'], 5)
+        self.assertEqual(len(self.mock.issues), 20)
+        
+        
+class TestDryRun(unittest.TestCase):
+    
+    def setUp(self):
+        import itertools
+        self.groups = list(itertools.islice(
+            iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'), 6))
+        
+    def test_payload_matches_export(self):
+        session = RecordingSession()
+        _json_to_jira(self.groups[0], '10108', 'user', 'http://jira/issue',
+                      session, JiraScheduler())
+        key, data = next(iter_payloads(self.groups, '10108', 'user'))
+        self.assertEqual(key, self.groups[0].ID)
+        self.assertEqual(data, session.posts[0][1])
+        
+    def test_round_trip(self):
+        import io
+        out = io.StringIO()
+        self.assertEqual(write_payloads(self.groups, out, '10108', 'user'), 6)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 6)
+        payloads = list(read_payloads(io.StringIO(out.getvalue() + '\n')))
+        self.assertEqual([x[0] for x in payloads], [x.ID for x in self.groups])
+        self.assertEqual([x[1] for x in payloads], lines)
+        
+    def test_bad_line(self):
+        import io
+        with self.assertRaises(Exception):
+            list(read_payloads(io.StringIO('{"fields": {}}\n')))
+            
+    def test_upload(self):
+        import io
+        out = io.StringIO()
+        write_payloads(self.groups, out, '10108', 'user')
+        with MockJira(seed=1) as mock:
+            results = upload_payloads(read_payloads(io.StringIO(out.getvalue())),
+                                      mock.issue_url, 3, None, JiraScheduler())
+            self.assertEqual(results, dict((x.ID, True) for x in self.groups))
+            self.assertEqual(sorted(x['fields']['labels'][0] 
+                                    for x in mock.issues.values()),
+                             sorted(x.ID for x in self.groups))
+                             
+    def test_upload_sequential(self):
+        session = RecordingSession()
+        payloads = iter_payloads(self.groups, '10108', 'user')
+        results = upload_payloads(payloads, 'http://jira/issue', 1, session,
+                                  JiraScheduler())
+        self.assertEqual(len(session.posts), 6)
+        self.assertTrue(all(x is True for x in results.values()))
+        
+        
+class TestMetrics(unittest.TestCase):
+    
+    def setUp(self):
+        self.metrics = Metrics()
+        
+    def test_counters_and_histograms(self):
+        self.metrics.incr('http_failures_total', status=503)
+        self.metrics.incr('http_failures_total', 2, status=503)
+        self.metrics.observe('http_request_seconds', 0.003)
+        self.metrics.observe('http_request_seconds', 20)
+        self.assertEqual(self.metrics.counter('http_failures_total', status=503), 3)
+        hist = self.metrics.to_dict()['histograms']['http_request_seconds'][0]
+        self.assertEqual(hist['count'], 2)
+        self.assertEqual(hist['counts'][1], 1)
+        self.assertEqual(hist['counts'][-1], 1)
+        self.assertIn('http_failures_total{status="503"}: 3', self.metrics.summary())
+        
+    def test_merge(self):
+        other = Metrics()
+        other.incr('http_failures_total', status=503)
+        other.observe('http_request_seconds', 0.003)
+        self.metrics.incr('http_failures_total', 2, status=503)
+        self.metrics.observe('http_request_seconds', 0.003)
+        self.metrics.merge(other.to_dict())
+        self.assertEqual(self.metrics.counter('http_failures_total', status=503), 3)
+        hist = self.metrics.to_dict()['histograms']['http_request_seconds'][0]
+        self.assertEqual(hist['count'], 2)
+        self.assertEqual(hist['counts'][1], 2)
+        
+    def test_prometheus_textfile(self):
+        import tempfile
+        self.metrics.incr('groups_parsed_total', 5)
+        with self.metrics.timer('parse_group_seconds'):
+            pass
+        handle, path = tempfile.mkstemp(suffix='.prom')
+        os.close(handle)
+        self.metrics.write_prometheus(path)
+        with open(path) as f:
+            text = f.read()
+        os.remove(path)
+        self.assertIn('# TYPE stig2jira_groups_parsed_total counter', text)
+        self.assertIn('stig2jira_groups_parsed_total 5', text)
+        self.assertIn('stig2jira_parse_group_seconds_bucket{le="+Inf"} 1', text)
+        self.assertIn('stig2jira_parse_group_seconds_count 1', text)
+        
+    def test_scheduler_reports(self):
+        group = next(iter_groups('U_Windows_7_V1R13_STIG_Manual-xccdf.xml'))
+        scheduler = JiraScheduler(max_retries=1, base_delay=0.001, 
+                                  metrics=self.metrics)
+        session = RecordingSession([FakeResponse(503), FakeResponse(503)])
+        _json_to_jira(group, '10108', 'user', 'http://jira/rest/api/2/issue',
+                      session, scheduler)
+        self.assertEqual(self.metrics.counter('http_retries_total'), 1)
+        self.assertEqual(self.metrics.counter('http_failures_total', status=503), 1)
+        self.assertEqual(self.metrics.counter('http_responses_total', 
+                                              method='POST', status=503), 2)
+        self.assertGreater(self.metrics.counter('payload_bytes_total', 
+                                                method='POST'), 0)
+                                                
+    def test_parse_only_modes_write_metrics(self):
+        import tempfile
+        import shutil
+        import contextlib
+        directory = tempfile.mkdtemp()
+        try:
+            for mode in (['--report', os.path.join(directory, 'r.html')],
+                         ['--dry-run', os.path.join(directory, 'p.ndjson')],
+                         ['--tables', os.path.join(directory, 'tables')]):
+                path = os.path.join(directory, 'metrics.json')
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.assertTrue(main(mode + ['--metrics', path]))
+                with open(path) as f:
+                    self.assertIn('parse_group_seconds', json.load(f)['histograms'])
+                os.remove(path)
+        finally:
+            shutil.rmtree(directory)
+            
+    def test_failed_export_writes_metrics(self):
+        import tempfile
+        import shutil
+        import contextlib
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'metrics.json')
+        mock = MockJira(seed=1, error_rate=1.0).start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertFalse(main(['--bulk', '50', '--url', mock.issue_url, 
+                                       '--retries', '0', '--metrics', path]))
+            os.remove(path)
+            mock.stop()
+            with contextlib.redirect_stdout(io.StringIO()):
+                with self.assertRaises(requests.ConnectionError):
+                    main(['--bulk', '50', '--url', mock.issue_url, 
+                          '--retries', '0', '--metrics', path])
+            with open(path) as f:
+                self.assertIn('parse_group_seconds', json.load(f)['histograms'])
+        finally:
+            mock.stop()
+            shutil.rmtree(directory)
             
 if __name__ == '__main__':
     suiteCheck = unittest.TestLoader().loadTestsFromTestCase(UnitTestCheckCheck)
@@ -391,6 +1632,29 @@ if __name__ == '__main__':
     suiteRule = unittest.TestLoader().loadTestsFromTestCase(UnitTestCheckRule)
     suiteGroup = unittest.TestLoader().loadTestsFromTestCase(UnitTestCheckGroup)
     suiteXML = unittest.TestLoader().loadTestsFromTestCase(TestReadXML)
+    suiteStream = unittest.TestLoader().loadTestsFromTestCase(TestIterGroups)
+    suiteBatch = unittest.TestLoader().loadTestsFromTestCase(TestParseBenchmarks)
+    suiteSession = unittest.TestLoader().loadTestsFromTestCase(TestJiraSession)
+    suiteBulk = unittest.TestLoader().loadTestsFromTestCase(TestBulkToJira)
+    suiteAsync = unittest.TestLoader().loadTestsFromTestCase(TestAsyncToJira)
+    suiteRetry = unittest.TestLoader().loadTestsFromTestCase(TestJiraScheduler)
+    suiteSync = unittest.TestLoader().loadTestsFromTestCase(TestSyncToJira)
+    suiteJournal = unittest.TestLoader().loadTestsFromTestCase(TestExportJournal)
+    suiteCache = unittest.TestLoader().loadTestsFromTestCase(TestLoadGroups)
+    suiteIndex = unittest.TestLoader().loadTestsFromTestCase(TestStigBenchmark)
+    suiteProfile = unittest.TestLoader().loadTestsFromTestCase(TestProfileSelection)
+    suiteReport = unittest.TestLoader().loadTestsFromTestCase(TestWriteReport)
+    suiteDiff = unittest.TestLoader().loadTestsFromTestCase(TestDiffBenchmarks)
+    suiteMock = unittest.TestLoader().loadTestsFromTestCase(TestMockJira)
+    suiteMetrics = unittest.TestLoader().loadTestsFromTestCase(TestMetrics)
+    suiteDryRun = unittest.TestLoader().loadTestsFromTestCase(TestDryRun)
+    suitePriority = unittest.TestLoader().loadTestsFromTestCase(TestPriorityPolicy)
+    suiteTables = unittest.TestLoader().loadTestsFromTestCase(TestWriteTables)
+    suiteSearch = unittest.TestLoader().loadTestsFromTestCase(TestSearchIndex)
+    suiteLazy = unittest.TestLoader().loadTestsFromTestCase(TestLazyGroups)
+    suiteGroupIndex = unittest.TestLoader().loadTestsFromTestCase(TestGroupIndex)
+    suiteReconcile = unittest.TestLoader().loadTestsFromTestCase(TestReconcile)
+    suiteFanOut = unittest.TestLoader().loadTestsFromTestCase(TestFanOut)
     unittest.TextTestRunner(verbosity=2).run(suiteCheck)
     unittest.TextTestRunner(verbosity=2).run(suiteReference)
     unittest.TextTestRunner(verbosity=2).run(suiteFix)
@@ -399,4 +1663,27 @@ if __name__ == '__main__':
     unittest.TextTestRunner(verbosity=2).run(suiteRule)
     unittest.TextTestRunner(verbosity=2).run(suiteGroup)
     unittest.TextTestRunner(verbosity=2).run(suiteXML)
+    unittest.TextTestRunner(verbosity=2).run(suiteStream)
+    unittest.TextTestRunner(verbosity=2).run(suiteBatch)
+    unittest.TextTestRunner(verbosity=2).run(suiteSession)
+    unittest.TextTestRunner(verbosity=2).run(suiteBulk)
+    unittest.TextTestRunner(verbosity=2).run(suiteAsync)
+    unittest.TextTestRunner(verbosity=2).run(suiteRetry)
+    unittest.TextTestRunner(verbosity=2).run(suiteSync)
+    unittest.TextTestRunner(verbosity=2).run(suiteJournal)
+    unittest.TextTestRunner(verbosity=2).run(suiteCache)
+    unittest.TextTestRunner(verbosity=2).run(suiteIndex)
+    unittest.TextTestRunner(verbosity=2).run(suiteProfile)
+    unittest.TextTestRunner(verbosity=2).run(suiteReport)
+    unittest.TextTestRunner(verbosity=2).run(suiteDiff)
+    unittest.TextTestRunner(verbosity=2).run(suiteMock)
+    unittest.TextTestRunner(verbosity=2).run(suiteMetrics)
+    unittest.TextTestRunner(verbosity=2).run(suiteDryRun)
+    unittest.TextTestRunner(verbosity=2).run(suitePriority)
+    unittest.TextTestRunner(verbosity=2).run(suiteTables)
+    unittest.TextTestRunner(verbosity=2).run(suiteSearch)
+    unittest.TextTestRunner(verbosity=2).run(suiteLazy)
+    unittest.TextTestRunner(verbosity=2).run(suiteGroupIndex)
+    unittest.TextTestRunner(verbosity=2).run(suiteReconcile)
+    unittest.TextTestRunner(verbosity=2).run(suiteFanOut)
     #unittest.main()
\ No newline at end of file